@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BookhouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookHouse'
+
+    def ready(self):
+        from bookHouse import signals  # noqa: F401
+        # обертка учета SQL-запросов ставится на соединения с первого подключения
+        import library.metrics  # noqa: F401
@@ -0,0 +1,55 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from bookHouse.cache import invalidate_models
+from bookHouse.models import MoveBookJournal, MoveBookJournalArchive
+from bookHouse.transactions import atomic_with_retry
+
+ARCHIVE_FIELDS = ['id', 'book_id', 'from_book_shelf_id', 'to_book_shelf_id', 'date_time_move', 'librarian_id',
+                  'reader_id', 'outside_the_library', 'returned']
+
+
+def get_archive_settings():
+    return {'HORIZON_DAYS': 365, 'BATCH_SIZE': 5000, **getattr(settings, 'JOURNAL_ARCHIVE', {})}
+
+
+def get_archive_horizon():
+    return timezone.now() - datetime.timedelta(days=get_archive_settings()['HORIZON_DAYS'])
+
+
+def archivable_journal(before):
+    # незакрытая выдача и последняя запись книги остаются в журнале: по ним считаются книги на руках
+    later_move = MoveBookJournal.objects.filter(book=OuterRef('book'), id__gt=OuterRef('id'))
+    return MoveBookJournal.objects.filter(date_time_move__lt=before).exclude(
+        to_book_shelf__isnull=True, returned=False).filter(Exists(later_move))
+
+
+@atomic_with_retry
+def _archive_batch(before, batch_size):
+    rows = list(archivable_journal(before).order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+    if not rows:
+        return 0
+    MoveBookJournalArchive.objects.bulk_create([MoveBookJournalArchive(**row) for row in rows], batch_size=1000)
+    # удаление одним запросом: delete() по queryset вызвал бы сигналы для каждой строки
+    ids = [row['id'] for row in rows]
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE id IN (%s)' % (connection.ops.quote_name(MoveBookJournal._meta.db_table),
+                                                            ', '.join(['%s'] * len(ids))), ids)
+    invalidate_models(MoveBookJournal, MoveBookJournalArchive)
+    return len(rows)
+
+
+def archive_journal(before=None, batch_size=None):
+    # каждая пачка - своя транзакция, блокировка записи не держится на весь перенос
+    before = before or get_archive_horizon()
+    batch_size = batch_size or get_archive_settings()['BATCH_SIZE']
+    archived = 0
+    while True:
+        moved = _archive_batch(before, batch_size)
+        archived += moved
+        if moved < batch_size:
+            return archived
@@ -0,0 +1,83 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.utils.urls import replace_query_param
+
+from bookHouse.fast_list import get_row_encoder, FastJSONRenderer
+from bookHouse.models import Book, Reader, MoveBookJournal
+from bookHouse.serializers import BookSerializer, ReaderSerializer, MoveBookJournalSerializer, KeysetPageSerializer
+
+# чтение каталога без пула потоков ASGI: запросы идут через асинхронный ORM, ответ собирается кодировщиками строк
+renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), content_type='application/json', status=status)
+
+
+async def page_response(request, serializer_class, queryset, count=False):
+    params = KeysetPageSerializer(data=request.GET)
+    if not params.is_valid():
+        return json_response(params.errors, status=400)
+    page_size = params.validated_data['page_size']
+    after = params.validated_data.get('after')
+
+    encoder = get_row_encoder(serializer_class)
+    data = {}
+    if count:
+        data['count'] = await queryset.acount()
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    rows = [row async for row in queryset.order_by('pk').values(*encoder.columns)[:page_size + 1]]
+
+    data['next'] = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        data['next'] = replace_query_param(request.build_absolute_uri(), 'after', rows[-1]['pk'])
+    data['results'] = await encoder.aencode(rows)
+    return json_response(data)
+
+
+async def detail_response(serializer_class, queryset, pk):
+    encoder = get_row_encoder(serializer_class)
+    try:
+        row = await queryset.values(*encoder.columns).aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        return json_response({'detail': 'Не найдено.'}, status=404)
+    return json_response((await encoder.aencode([row]))[0])
+
+
+def filter_by_params(request, queryset, fields):
+    return queryset.filter(**{name: request.GET[name] for name in fields if name in request.GET})
+
+
+@require_GET
+async def book_list(request):
+    return await page_response(request, BookSerializer, filter_by_params(request, Book.objects.all(), ['name']))
+
+
+@require_GET
+async def book_detail(request, pk):
+    return await detail_response(BookSerializer, Book.objects.all(), pk)
+
+
+@require_GET
+async def book_journal(request, pk):
+    if not await Book.objects.filter(pk=pk).aexists():
+        return json_response({'detail': 'Не найдено.'}, status=404)
+    return await page_response(request, MoveBookJournalSerializer, MoveBookJournal.objects.filter(book=pk),
+                               count=True)
+
+
+@require_GET
+async def reader_list(request):
+    return await page_response(request, ReaderSerializer, filter_by_params(request, Reader.objects.all(), ['fio']))
+
+
+@require_GET
+async def reader_detail(request, pk):
+    return await detail_response(ReaderSerializer, Reader.objects.all(), pk)
+
+
+@require_GET
+async def move_book_list(request):
+    return await page_response(request, MoveBookJournalSerializer, MoveBookJournal.objects.all())
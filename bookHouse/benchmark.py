@@ -0,0 +1,253 @@
+import datetime
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.db import OperationalError, close_old_connections, connection, connections, reset_queries
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bookHouse.cache import get_response_cache
+from bookHouse.models import (Author, PublicationType, Librarian, BookHall, BookCase, BookShelf, Reader, Book,
+                              MoveBookJournal, MAX_BOOKS_ON_SHELF, MAX_BOOKS_ON_HANDS,
+                              rebuild_circulation_statistics, get_count_books_by_author, get_top_ten_books,
+                              count_book_on_hands_by_readers, get_halls_with_related_cases_and_shelfs,
+                              get_publications_with_books_that_not_taken, get_move_book_journal_shelves_by_book,
+                              get_books_on_hands_from_journal)
+from bookHouse.topology import invalidate_topology
+
+# размеры синтетической библиотеки; книг не больше 80% мест на полках, чтобы возврату было куда ставить
+SCALES = {
+    'small': {'halls': 2, 'cases': 3, 'shelves': 5, 'books': 200, 'authors': 50, 'readers': 50,
+              'journal': 2000},
+    'medium': {'halls': 5, 'cases': 10, 'shelves': 10, 'books': 3000, 'authors': 500, 'readers': 500,
+               'journal': 30000},
+    'large': {'halls': 10, 'cases': 20, 'shelves': 10, 'books': 15000, 'authors': 2000, 'readers': 2000,
+              'journal': 300000},
+}
+
+BATCH_SIZE = 1000
+# записи журнала одной пачки получают одно время, пачки идут с шагом в минуту
+JOURNAL_ROWS_PER_MINUTE = 100
+
+
+def generate_library(halls, cases, shelves, books, authors, readers, journal, seed=0):
+    rng = random.Random(seed)
+    librarian = Librarian.objects.create(fio='Библиотекарь')
+    publication_types = PublicationType.objects.bulk_create(
+        [PublicationType(name=name) for name in ('Печатное', 'Электронное', 'Аудио')])
+    BookHall.objects.bulk_create([BookHall(name='Зал %s' % (i + 1), librarian=librarian) for i in range(halls)])
+    BookCase.objects.bulk_create([BookCase(number=i + 1, book_hall=hall)
+                                  for hall in BookHall.objects.all() for i in range(cases)])
+    BookShelf.objects.bulk_create([BookShelf(number=i + 1, book_case=case)
+                                   for case in BookCase.objects.all() for i in range(shelves)],
+                                  batch_size=BATCH_SIZE)
+    shelf_ids = list(BookShelf.objects.values_list('pk', flat=True))
+    if books > len(shelf_ids) * MAX_BOOKS_ON_SHELF * 0.8:
+        raise ValueError('Книг больше, чем 80% мест на полках')
+
+    Author.objects.bulk_create([Author(fio='Автор %s' % (i + 1)) for i in range(authors)], batch_size=BATCH_SIZE)
+    Reader.objects.bulk_create([Reader(fio='Читатель %s' % (i + 1)) for i in range(readers)], batch_size=BATCH_SIZE)
+    Book.objects.bulk_create(
+        [Book(name='Книга %s' % (i + 1), number=i + 1, page_count=rng.randint(20, 900),
+              description='Описание книги %s' % (i + 1), publication_type=rng.choice(publication_types),
+              pub_date=datetime.date(1900, 1, 1) + datetime.timedelta(days=rng.randint(0, 45000)),
+              book_shelf_id=shelf_ids[i % len(shelf_ids)])
+         for i in range(books)], batch_size=BATCH_SIZE)
+    books_count = Book.objects.filter(book_shelf=OuterRef('pk')).values('book_shelf').annotate(
+        cnt=Count('pk')).values('cnt')
+    BookShelf.objects.update(books_count=Coalesce(Subquery(books_count), Value(0)))
+
+    author_ids = list(Author.objects.values_list('pk', flat=True))
+    book_shelves = dict(Book.objects.values_list('pk', 'book_shelf'))
+    max_authors = min(3, len(author_ids))
+    Book.author.through.objects.bulk_create(
+        [Book.author.through(book_id=book_id, author_id=author_id)
+         for book_id in book_shelves for author_id in rng.sample(author_ids, rng.randint(1, max_authors))],
+        batch_size=BATCH_SIZE)
+
+    # журнал из закрытых выдач: выдача и возврат на ту же полку, на руках после генерации ничего нет
+    reader_ids = list(Reader.objects.values_list('pk', flat=True))
+    book_ids = list(book_shelves)
+    rows = []
+    for _ in range(journal // 2):
+        book_id, reader_id = rng.choice(book_ids), rng.choice(reader_ids)
+        rows.append(MoveBookJournal(book_id=book_id, reader_id=reader_id, librarian=librarian,
+                                    from_book_shelf_id=book_shelves[book_id], outside_the_library=True,
+                                    returned=True))
+        rows.append(MoveBookJournal(book_id=book_id, reader_id=reader_id, librarian=librarian,
+                                    to_book_shelf_id=book_shelves[book_id], returned=True))
+        if len(rows) >= BATCH_SIZE:
+            MoveBookJournal.objects.bulk_create(rows)
+            rows = []
+    MoveBookJournal.objects.bulk_create(rows)
+
+    # date_time_move заполняется auto_now_add, разносим записи по времени отдельными UPDATE по диапазонам id
+    ids = list(MoveBookJournal.objects.order_by('pk').values_list('pk', flat=True)[::JOURNAL_ROWS_PER_MINUTE])
+    start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=len(ids))
+    for minute, (first_id, next_id) in enumerate(zip(ids, ids[1:] + [None])):
+        rows = MoveBookJournal.objects.filter(pk__gte=first_id)
+        if next_id is not None:
+            rows = rows.filter(pk__lt=next_id)
+        rows.update(date_time_move=start + datetime.timedelta(minutes=minute))
+
+    rebuild_circulation_statistics()
+    invalidate_topology()
+    get_response_cache().clear()
+
+
+def measure(func, repeat):
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(context.captured_queries)
+    reset_queries()
+    return {
+        'runs': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': queries,
+    }
+
+
+def bench_endpoints(repeat):
+    client = Client()
+    results = {}
+    for name, url in (('books', reverse('book-list')),
+                      ('books-1000', reverse('book-list') + '?page_size=1000'),
+                      ('shelfs', reverse('bookshelf-list')),
+                      ('move-book', reverse('movebookjournal-list')),
+                      ('move-book-1000', reverse('movebookjournal-list') + '?page_size=1000')):
+        def get(url=url):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError('%s ответил %s' % (url, response.status_code))
+        get()
+        results['endpoint:' + name] = measure(get, repeat)
+    return results
+
+
+def bench_reports(repeat):
+    author_fio = Author.objects.values_list('fio', flat=True).first()
+
+    def topology():
+        invalidate_topology()
+        get_halls_with_related_cases_and_shelfs()
+
+    reports = {
+        'get_count_books_by_author': lambda: get_count_books_by_author(author_fio),
+        'get_top_ten_books': lambda: list(get_top_ten_books()),
+        'count_book_on_hands_by_readers': lambda: list(count_book_on_hands_by_readers()),
+        'get_halls_with_related_cases_and_shelfs': topology,
+        'get_publications_with_books_that_not_taken': lambda: list(get_publications_with_books_that_not_taken()),
+        'get_move_book_journal_shelves_by_book': lambda: list(get_move_book_journal_shelves_by_book()),
+        'get_books_on_hands_from_journal': get_books_on_hands_from_journal,
+    }
+    return {'report:' + name: measure(func, repeat) for name, func in reports.items()}
+
+
+def bench_circulation(operations):
+    librarian = Librarian.objects.get()
+    readers = list(Reader.objects.all())
+    books = list(Book.objects.filter(book_shelf__isnull=False).order_by('pk')[:min(operations, len(readers) *
+                                                                                   MAX_BOOKS_ON_HANDS)])
+    loans = [(book, readers[i // MAX_BOOKS_ON_HANDS]) for i, book in enumerate(books)]
+    results = {}
+    for name, call in (('take_on_hands', lambda book, reader: book.take_on_hands(reader, librarian)),
+                       ('return_to_library', lambda book, reader: book.return_to_library(reader, librarian))):
+        started = time.perf_counter()
+        for book, reader in loans:
+            call(book, reader)
+        elapsed = time.perf_counter() - started
+        results['circulation:' + name] = {'runs': len(loans), 'ops_per_s': round(len(loans) / elapsed, 1),
+                                          'mean_ms': round(elapsed / len(loans) * 1000, 3)}
+    return results
+
+
+def bench_mixed_load(threads, seconds, write_ratio, seed=0):
+    # смешанная нагрузка через ORM в потоках, у каждого свое соединение Django. Запись - выдача или возврат
+    # своей книги своим читателем, чтение - полка книги и ее журнал. После операции соединение
+    # закрывается или остается по CONN_MAX_AGE, как в конце запроса. errors - блокировки, не снятые повторами
+    librarian = Librarian.objects.get()
+    readers = list(Reader.objects.order_by('pk')[:threads])
+    if len(readers) < threads:
+        raise ValueError('Читателей меньше, чем потоков')
+    book_ids = list(Book.objects.filter(book_shelf__isnull=False).order_by('pk').values_list('pk', flat=True))
+    counts = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        reader, own_book_ids = readers[number], book_ids[number::threads]
+        held = None
+        local = Counter()
+        try:
+            while time.perf_counter() < deadline:
+                write = rng.random() < write_ratio
+                try:
+                    if write and held is None:
+                        book = Book.objects.get(pk=rng.choice(own_book_ids))
+                        book.take_on_hands(reader, librarian)
+                        held = book
+                    elif write:
+                        held.return_to_library(reader, librarian)
+                        held = None
+                    else:
+                        book_id = rng.choice(book_ids)
+                        list(BookShelf.objects.filter(books=book_id).values_list('books_count', flat=True))
+                        MoveBookJournal.objects.filter(book=book_id).count()
+                except OperationalError:
+                    local['errors'] += 1
+                else:
+                    local['writes' if write else 'reads'] += 1
+                close_old_connections()
+        finally:
+            connections.close_all()
+            with lock:
+                counts.update(local)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {key: counts[key] for key in ('reads', 'writes', 'errors')}
+
+
+def run_benchmarks(scale, repeat=5, operations=200, seed=0):
+    generate_library(**SCALES[scale], seed=seed)
+    results = {}
+    results.update(bench_endpoints(repeat))
+    results.update(bench_reports(repeat))
+    results.update(bench_circulation(operations))
+    return results
+
+
+def typical_ms(result):
+    # у замеров оборота медианы нет, только среднее на операцию
+    return result['median_ms'] if 'median_ms' in result else result['mean_ms']
+
+
+def compare_results(baseline, current, threshold):
+    # (scale, name, old ms, new ms, ratio) по общим замерам; ratio > threshold считается регрессией
+    rows = []
+    for scale, benchmarks in current.items():
+        for name, result in benchmarks.items():
+            old = baseline.get(scale, {}).get(name)
+            if old is None:
+                continue
+            old_ms, new_ms = typical_ms(old), typical_ms(result)
+            ratio = new_ms / old_ms if old_ms else 1.0
+            rows.append((scale, name, old_ms, new_ms, ratio, ratio > threshold))
+    return rows
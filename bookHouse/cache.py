@@ -0,0 +1,94 @@
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+GENERATION_KEY = 'response-cache:generation:%s'
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def _get_settings():
+    return getattr(settings, 'RESPONSE_CACHE', {})
+
+
+def get_response_cache():
+    return caches[_get_settings().get('ALIAS', 'default')]
+
+
+def _bump_generations(labels):
+    cache = get_response_cache()
+    for label in labels:
+        key = GENERATION_KEY % label
+        # add не перезапишет счетчик, созданный параллельно
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def invalidate_models(*models):
+    labels = [model._meta.label_lower for model in models]
+    _bump_generations(labels)
+    # повторно после коммита: ответ могли закэшировать по еще не зафиксированным данным
+    transaction.on_commit(lambda: _bump_generations(labels))
+
+
+def get_generations(models):
+    keys = [GENERATION_KEY % model._meta.label_lower for model in models]
+    values = get_response_cache().get_many(keys)
+    return [values.get(key, 0) for key in keys]
+
+
+def record(name, hit):
+    with _stats_lock:
+        _stats[(name, 'hits' if hit else 'misses')] += 1
+
+
+def get_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    names = sorted({name for name, kind in stats})
+    return {name: {'hits': stats.get((name, 'hits'), 0), 'misses': stats.get((name, 'misses'), 0)}
+            for name in names}
+
+
+class CachedResponseMixin:
+    # модели, изменение которых сбрасывает закэшированные ответы вьюсета
+    cache_models = ()
+    cache_timeout = None
+
+    def get_cache_key(self, request):
+        generations = '.'.join(str(generation) for generation in get_generations(self.cache_models))
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        return 'response-cache:%s:%s:%s:%s' % (self.basename, self.action, generations, url)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not self.cache_models:
+            return handler(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record(self.basename, hit=True)
+            return Response(data)
+
+        record(self.basename, hit=False)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout or _get_settings().get('TIMEOUT', 300)
+            cache.set(key, response.data, timeout=timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
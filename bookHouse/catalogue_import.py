@@ -0,0 +1,111 @@
+import csv
+import json
+from itertools import islice
+
+from bookHouse.cache import invalidate_models
+from bookHouse.models import Book, Author, PublicationType
+from bookHouse.serializers import BookImportSerializer
+from bookHouse.transactions import atomic_with_retry
+
+IMPORT_CHUNK_SIZE = 1000
+CSV_AUTHORS_SEPARATOR = ';'
+
+
+def read_json_lines(lines):
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            # некорректная строка попадет в отчет об ошибках как невалидные данные
+            yield line_number, line
+
+
+def read_csv(lines):
+    # CSV с колонками полей BookSerializer: авторы через ';', тип публикации по названию
+    reader = csv.DictReader(lines)
+    for row in reader:
+        authors = row.get('author') or ''
+        row['author'] = [{'fio': fio.strip()} for fio in authors.split(CSV_AUTHORS_SEPARATOR) if fio.strip()]
+        row['publication_type'] = {'name': row.get('publication_type') or ''}
+        row['pub_date'] = row.get('pub_date') or None
+        yield reader.line_num, row
+
+
+READERS = {
+    'jsonl': read_json_lines,
+    'csv': read_csv,
+}
+
+
+def _get_or_create_by_name(model, field, names):
+    found = {}
+    for pk, name in model.objects.filter(**{field + '__in': names}).order_by('id').values_list('id', field):
+        found.setdefault(name, pk)
+    missing = [name for name in names if name not in found]
+    for obj in model.objects.bulk_create([model(**{field: name}) for name in missing]):
+        found[getattr(obj, field)] = obj.pk
+    return found
+
+
+@atomic_with_retry
+def _import_chunk(chunk):
+    # ошибки возвращаются, а не дописываются в общий список: при повторе транзакции они не задвоятся
+    errors = []
+    valid = []
+    numbers = set()
+    for line, row in chunk:
+        serializer = BookImportSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'line': line, 'errors': serializer.errors})
+        elif serializer.validated_data['number'] in numbers:
+            errors.append({'line': line, 'errors': {'number': ["Номер книги повторяется в файле."]}})
+        else:
+            numbers.add(serializer.validated_data['number'])
+            valid.append((line, serializer.validated_data))
+
+    existing = set(Book.objects.filter(number__in=numbers).values_list('number', flat=True))
+    rows = []
+    for line, data in valid:
+        if data['number'] in existing:
+            errors.append({'line': line, 'errors': {'number': ["Книга с таким номером уже существует."]}})
+        else:
+            rows.append(data)
+
+    publication_types = _get_or_create_by_name(
+        PublicationType, 'name', list(dict.fromkeys(data['publication_type']['name'] for data in rows)))
+    authors = _get_or_create_by_name(
+        Author, 'fio', list(dict.fromkeys(author['fio'] for data in rows for author in data['author'])))
+
+    books = Book.objects.bulk_create([
+        Book(name=data['name'], pub_date=data.get('pub_date'), number=data['number'],
+             page_count=data['page_count'], description=data['description'],
+             publication_type_id=publication_types[data['publication_type']['name']])
+        for data in rows])
+
+    through = Book.author.through
+    through.objects.bulk_create([
+        through(book_id=book.pk, author_id=author_id)
+        for book, data in zip(books, rows)
+        for author_id in dict.fromkeys(authors[author['fio']] for author in data['author'])])
+
+    # bulk_create не отправляет сигналы, кэш ответов сбрасываем явно
+    invalidate_models(Book, Author, PublicationType, through)
+
+    return len(books), errors
+
+
+def import_books(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    # rows - пары (номер строки, данные); файл читается и записывается пачками,
+    # в памяти держится только текущая пачка
+    result = {'created': 0, 'errors': []}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return result
+        created, errors = _import_chunk(chunk)
+        result['created'] += created
+        result['errors'].extend(errors)
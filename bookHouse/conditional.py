@@ -0,0 +1,55 @@
+import hashlib
+from calendar import timegm
+
+from django.db import connection
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from bookHouse.models import TableVersion
+
+
+def table_versions_supported():
+    # версии таблиц ведут триггеры: SQLite - миграции 0011 и 0016, PostgreSQL - 0017
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def get_table_versions(models):
+    tables = sorted({model._meta.db_table for model in models})
+    return list(TableVersion.objects.filter(name__in=tables).order_by('name').values_list(
+        'name', 'version', 'modified'))
+
+
+class ConditionalGetMixin:
+    # модели, из таблиц которых собирается ответ: их версии дают ETag и Last-Modified без запроса списка
+    version_models = ()
+
+    def get_validators(self, request):
+        versions = get_table_versions(self.version_models)
+        key = '|'.join([self.basename, self.action, request.build_absolute_uri(), request.headers.get('Accept', ''),
+                        ','.join('%s:%s' % (name, version) for name, version, modified in versions)])
+        etag = '"%s"' % hashlib.md5(key.encode()).hexdigest()
+        last_modified = max((modified for name, version, modified in versions), default=None)
+        return etag, last_modified
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        if not self.version_models or not table_versions_supported():
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request)
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
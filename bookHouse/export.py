@@ -0,0 +1,86 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+
+from bookHouse.models import Book, Reader, GroupConcat, get_journal_values_list
+from bookHouse.catalogue_import import CSV_AUTHORS_SEPARATOR
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (колонка выгрузки, поле values_list); колонки каталога совпадают с форматом импорта
+EXPORT_COLUMNS = {
+    'move-book': [
+        ('id', 'id'),
+        ('date_time_move', 'date_time_move'),
+        ('book_number', 'book__number'),
+        ('book', 'book__name'),
+        ('from_book_shelf', 'from_book_shelf'),
+        ('to_book_shelf', 'to_book_shelf'),
+        ('librarian', 'librarian__fio'),
+        ('reader', 'reader__fio'),
+        ('outside_the_library', 'outside_the_library'),
+        ('returned', 'returned'),
+    ],
+    'books': [
+        ('name', 'name'),
+        ('author', 'authors'),
+        ('pub_date', 'pub_date'),
+        ('publication_type', 'publication_type__name'),
+        ('number', 'number'),
+        ('page_count', 'page_count'),
+        ('description', 'description'),
+        ('book_shelf', 'book_shelf'),
+    ],
+    'readers': [
+        ('id', 'id'),
+        ('fio', 'fio'),
+    ],
+}
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+
+def get_export_queryset(name, date_from=None, date_to=None):
+    lookups = [lookup for column, lookup in EXPORT_COLUMNS[name]]
+    if name == 'move-book':
+        # архив журнала подключается, только если период его захватывает
+        return get_journal_values_list(lookups, date_from, date_to).order_by('date_time_move', 'id')
+    if name == 'books':
+        authors = Book.author.through.objects.filter(book=OuterRef('pk')).values('book').annotate(
+            fios=GroupConcat('author__fio', separator=CSV_AUTHORS_SEPARATOR + ' ')).values('fios')
+        queryset = Book.objects.annotate(authors=Subquery(authors)).order_by('id')
+    else:
+        queryset = Reader.objects.order_by('id')
+    return queryset.values_list(*lookups)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _stream_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _stream_ndjson(columns, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def stream_export(name, export_format='csv', date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # строки читаются курсором пачками и сразу отдаются, выгрузка целиком в памяти не собирается
+    columns = [column for column, lookup in EXPORT_COLUMNS[name]]
+    rows = get_export_queryset(name, date_from, date_to).iterator(chunk_size=chunk_size)
+    if export_format == 'ndjson':
+        return _stream_ndjson(columns, rows)
+    return _stream_csv(columns, rows)
+
+
+def export_content_type(export_format):
+    return 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
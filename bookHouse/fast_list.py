@@ -0,0 +1,142 @@
+import datetime
+from functools import lru_cache
+
+from django.db.models import F
+from rest_framework import serializers, ISO_8601
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# поля, значение которых сериализатор отдает как есть или простым приведением типа
+SCALAR_FIELDS = {
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+    serializers.BooleanField: bool,
+}
+
+OWNER_KEY = '_fast_list_owner'
+
+
+def _value(column, convert=None):
+    if convert is None:
+        return lambda row: row[column]
+    return lambda row: None if row[column] is None else convert(row[column])
+
+
+def _nested(column, encoder):
+    return lambda row: None if row[column] is None else encoder.encode_row(row)
+
+
+class RowEncoder:
+    # собранный заранее перевод строки values() в словарь, совпадающий с to_representation сериализатора
+    def __init__(self, model, columns, fields, relations):
+        self.model = model
+        self.columns = columns
+        self.fields = fields
+        self.relations = relations
+
+    def encode_row(self, row, related=None):
+        data = {}
+        for name, getter in self.fields:
+            if getter is None:
+                data[name] = related[name].get(row['pk'], [])
+            else:
+                data[name] = getter(row)
+        return data
+
+    def related_rows(self, query_name, encoder, pks):
+        return encoder.model._default_manager.filter(**{query_name + '__in': pks}).values(
+            *encoder.columns, **{OWNER_KEY: F(query_name)})
+
+    def load_related(self, pks):
+        related = {}
+        for name, query_name, encoder in self.relations:
+            items = related[name] = {}
+            for row in self.related_rows(query_name, encoder, pks):
+                items.setdefault(row[OWNER_KEY], []).append(encoder.encode_row(row))
+        return related
+
+    async def aload_related(self, pks):
+        related = {}
+        for name, query_name, encoder in self.relations:
+            items = related[name] = {}
+            async for row in self.related_rows(query_name, encoder, pks):
+                items.setdefault(row[OWNER_KEY], []).append(encoder.encode_row(row))
+        return related
+
+    def encode(self, rows):
+        rows = list(rows)
+        related = self.load_related([row['pk'] for row in rows]) if self.relations else None
+        return [self.encode_row(row, related) for row in rows]
+
+    async def aencode(self, rows):
+        # строки уже выбраны вызывающим кодом, асинхронно догружаются только связи
+        related = await self.aload_related([row['pk'] for row in rows]) if self.relations else None
+        return [self.encode_row(row, related) for row in rows]
+
+
+def compile_row_encoder(serializer, prefix=''):
+    model = serializer.Meta.model
+    columns = []
+    fields = []
+    relations = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source != name:
+            return None
+        column = prefix + name
+        kind = type(field)
+
+        if kind in SCALAR_FIELDS:
+            columns.append(column)
+            fields.append((name, _value(column, SCALAR_FIELDS[kind])))
+        elif kind is serializers.DateField:
+            if getattr(field, 'format', api_settings.DATE_FORMAT).lower() != ISO_8601:
+                return None
+            columns.append(column)
+            fields.append((name, _value(column, datetime.date.isoformat)))
+        elif kind is serializers.PrimaryKeyRelatedField and field.pk_field is None:
+            columns.append(column)
+            fields.append((name, _value(column)))
+        elif kind is serializers.SlugRelatedField:
+            columns.append('%s__%s' % (column, field.slug_field))
+            fields.append((name, _value('%s__%s' % (column, field.slug_field))))
+        elif isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            model_field = model._meta.get_field(name)
+            encoder = compile_row_encoder(field.child)
+            if prefix or not model_field.many_to_many or encoder is None or encoder.relations:
+                return None
+            relations.append((name, model_field.related_query_name(), encoder))
+            fields.append((name, None))
+        elif isinstance(field, serializers.ModelSerializer):
+            encoder = compile_row_encoder(field, column + '__')
+            if encoder is None or encoder.relations:
+                return None
+            columns.append(column)
+            columns.extend(encoder.columns)
+            fields.append((name, _nested(column, encoder)))
+        else:
+            return None
+
+    if not prefix:
+        columns.append('pk')
+    return RowEncoder(model, columns, fields, relations)
+
+
+@lru_cache(maxsize=None)
+def get_row_encoder(serializer_class):
+    # None - в сериализаторе есть поля, которые нельзя собрать из values(), список отдается обычным путем
+    return compile_row_encoder(serializer_class())
+
+
+class FastJSONRenderer(JSONRenderer):
+    # данные быстрого списка - только str, int, bool, None, list и dict, для них orjson дает тот же JSON
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data).replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,131 @@
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from bookHouse.models import (Book, BookShelf, BookOnHands, MoveBookJournal, MoveBookJournalArchive,
+                              LocationSnapshot, LocationSnapshotEntry, _scope_shelves)
+from bookHouse.transactions import atomic_with_retry
+
+# Состояние на момент moment - расстановка после всех записей журнала с date_time_move < moment.
+# Оно собирается от ближайшего предыдущего снимка применением записей после него, так что объем чтения журнала
+# ограничен интервалом между снимками, а не всей историей. До первого снимка записи откатываются назад
+# по from_book_shelf (у старых выдач его заполнила миграция 0015).
+# Снимки делает только take_location_snapshot по расписанию, чтение истории в БД не пишет.
+# Создание книг в журнал не пишется: книга без перемещений относится к снимку, от которого идет расчет.
+
+MOVE_FIELDS = ('id', 'book', 'from_book_shelf', 'to_book_shelf')
+CURRENT_STATE_ATTEMPTS = 3
+
+
+def get_snapshot_settings():
+    return {'INTERVAL_DAYS': 7, **getattr(settings, 'LOCATION_SNAPSHOTS', {})}
+
+
+def _last_move_id():
+    ids = [journal.objects.aggregate(last=Max('id'))['last'] for journal in (MoveBookJournal, MoveBookJournalArchive)]
+    return max([move_id for move_id in ids if move_id is not None], default=0)
+
+
+@atomic_with_retry
+def take_location_snapshot():
+    # в той же транзакции, что и чтение журнала: между ними не вклинится выдача
+    snapshot = LocationSnapshot.objects.create(taken_at=timezone.now(), last_move_id=_last_move_id())
+    LocationSnapshotEntry.objects.bulk_create(
+        (LocationSnapshotEntry(snapshot=snapshot, book_id=book_id, book_shelf_id=book_shelf_id)
+         for book_id, book_shelf_id in Book.objects.values_list('id', 'book_shelf').iterator()),
+        batch_size=1000)
+    return snapshot
+
+
+def snapshot_due():
+    latest = LocationSnapshot.objects.order_by('-taken_at').values_list('taken_at', flat=True).first()
+    interval = datetime.timedelta(days=get_snapshot_settings()['INTERVAL_DAYS'])
+    return latest is None or timezone.now() - latest >= interval
+
+
+def get_nearest_snapshot(moment):
+    # (снимок, вперед ли от него считать). Основной путь - вперед от предыдущего снимка: снимки идут
+    # с интервалом INTERVAL_DAYS, и повтор не длиннее интервала. Назад - только до первого снимка:
+    # от следующего снимка или, если снимков нет, от текущей расстановки (тогда снимок None)
+    before = LocationSnapshot.objects.filter(taken_at__lte=moment).order_by('-taken_at').first()
+    if before is not None:
+        return before, True
+    after = LocationSnapshot.objects.filter(taken_at__gt=moment).order_by('taken_at').first()
+    return after, after is None and moment >= timezone.now()
+
+
+def _current_state(read):
+    # последняя запись журнала читается до и после расстановки: выдача между чтениями - повод перечитать,
+    # при непрерывной записи чтение идет под блокировкой записи
+    for _ in range(CURRENT_STATE_ATTEMPTS):
+        last_move_id = _last_move_id()
+        state = read()
+        if _last_move_id() == last_move_id:
+            return last_move_id, state
+    return atomic_with_retry(lambda: (_last_move_id(), read()))()
+
+
+def get_baseline(moment, read):
+    # (последняя учтенная запись журнала, вперед ли считать, read(строки "книга, полка") ближайшей расстановки)
+    snapshot, forward = get_nearest_snapshot(moment)
+    if snapshot is not None:
+        return snapshot.last_move_id, forward, read(snapshot.entries.values_list('book', 'book_shelf'))
+    last_move_id, state = _current_state(lambda: read(Book.objects.values_list('id', 'book_shelf')))
+    return last_move_id, forward, state
+
+
+def get_replay_moves(last_move_id, moment, forward):
+    # архивные записи сохраняют id журнала, поэтому обе таблицы режутся одной границей
+    if forward:
+        lookups, order = {'id__gt': last_move_id, 'date_time_move__lt': moment}, 'id'
+    else:
+        lookups, order = {'id__lte': last_move_id, 'date_time_move__gte': moment}, '-id'
+    querysets = [journal.objects.filter(**lookups).values_list(*MOVE_FIELDS)
+                 for journal in (MoveBookJournal, MoveBookJournalArchive)]
+    return querysets[0].union(querysets[1], all=True).order_by(order)
+
+
+def get_book_locations(moment):
+    # {id книги: id полки или None, если книга на руках}
+    last_move_id, forward, locations = get_baseline(moment, dict)
+    for move_id, book_id, from_book_shelf_id, to_book_shelf_id in get_replay_moves(last_move_id, moment, forward):
+        locations[book_id] = to_book_shelf_id if forward else from_book_shelf_id
+    return locations
+
+
+def get_shelf_occupancy(moment, scope=None):
+    # счетчики из расстановки одним GROUP BY, затем поправка на каждое перемещение: минус полке, откуда, плюс - куда
+    shelves = _scope_shelves(scope) if scope is not None else BookShelf.objects.all()
+    shelf_ids = list(shelves.order_by('id').values_list('id', flat=True))
+    last_move_id, forward, counts = get_baseline(moment, lambda rows: Counter(dict(
+        rows.filter(book_shelf__in=shelf_ids).order_by().values('book_shelf').annotate(
+            cnt=Count('pk')).values_list('book_shelf', 'cnt'))))
+    sign = 1 if forward else -1
+    for move_id, book_id, from_book_shelf_id, to_book_shelf_id in get_replay_moves(last_move_id, moment, forward):
+        counts[from_book_shelf_id] -= sign
+        counts[to_book_shelf_id] += sign
+    return [{'book_shelf': shelf_id, 'books_count': counts[shelf_id]} for shelf_id in shelf_ids]
+
+
+def get_book_location(book, moment):
+    # одна книга - по ее собственным записям журнала, снимки не нужны
+    def moves(**lookups):
+        querysets = [journal.objects.filter(book=book, **lookups).values_list(
+            'id', 'from_book_shelf', 'to_book_shelf', 'reader')
+            for journal in (MoveBookJournal, MoveBookJournalArchive)]
+        return querysets[0].union(querysets[1], all=True)
+
+    last = moves(date_time_move__lt=moment).order_by('-id').first()
+    if last is not None:
+        move_id, from_book_shelf_id, to_book_shelf_id, reader_id = last
+        return {'book_shelf': to_book_shelf_id, 'reader': reader_id if to_book_shelf_id is None else None}
+    following = moves(date_time_move__gte=moment).order_by('id').first()
+    if following is not None:
+        # перемещение после момента начиналось оттуда, где книга была; без полки - это возврат с рук
+        move_id, from_book_shelf_id, to_book_shelf_id, reader_id = following
+        return {'book_shelf': from_book_shelf_id, 'reader': reader_id if from_book_shelf_id is None else None}
+    on_hands = BookOnHands.objects.filter(book=book).values_list('reader', flat=True).first()
+    return {'book_shelf': book.book_shelf_id, 'reader': on_hands}
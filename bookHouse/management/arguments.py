@@ -0,0 +1,15 @@
+import argparse
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def datetime_argument(value):
+    # parse_datetime возвращает None на нераспознанную строку, а опечатка в дате не должна молча снимать фильтр
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise argparse.ArgumentTypeError('Неверная дата %r, ожидается ISO 8601, например 2024-01-31T12:00' % value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
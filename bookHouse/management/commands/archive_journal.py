@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from bookHouse.archive import archive_journal, archivable_journal, get_archive_horizon
+from bookHouse.management.arguments import datetime_argument
+
+
+class Command(BaseCommand):
+    help = 'Переносит закрытые записи журнала старше горизонта (JOURNAL_ARCHIVE) в архивную таблицу пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=datetime_argument,
+                            help='Архивировать записи раньше этого времени, ISO 8601; по умолчанию - горизонт')
+        parser.add_argument('--batch-size', type=int, help='Записей в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать записи для архивации')
+
+    def handle(self, *args, **options):
+        before = options['before'] or get_archive_horizon()
+        if options['dry_run']:
+            self.stdout.write('Будет перенесено в архив: %s' % archivable_journal(before).count())
+            return
+        self.stdout.write('Перенесено в архив: %s' % archive_journal(before, options['batch_size']))
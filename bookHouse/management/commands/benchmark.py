@@ -0,0 +1,81 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from bookHouse.benchmark import SCALES, run_benchmarks, compare_results
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеры списков /books/, /shelfs/, /move-book/, выдачи/возврата и отчетов models.py '
+            'на синтетической библиотеке во временной тестовой БД. Результат - JSON для сравнения между коммитами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='small,medium',
+                            help='Размеры через запятую: %s' % ', '.join(SCALES))
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого замера')
+        parser.add_argument('--operations', type=int, default=200, help='Выдач и возвратов в замере оборота')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON, по умолчанию stdout')
+        parser.add_argument('--compare', help='JSON прошлого запуска: вывести изменение медиан')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Во сколько раз медиана может вырасти без сообщения о регрессии')
+
+    def handle(self, *args, **options):
+        scales = [scale.strip() for scale in options['scales'].split(',') if scale.strip()]
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise CommandError('Неизвестные размеры: %s' % ', '.join(sorted(unknown)))
+
+        report = {
+            'commit': current_commit(),
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scales': {scale: SCALES[scale] for scale in scales},
+            'results': {},
+        }
+
+        # замеры идут в отдельной тестовой БД, рабочая база не меняется
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for scale in scales:
+                call_command('flush', interactive=False, verbosity=0)
+                report['results'][scale] = run_benchmarks(scale, options['repeat'], options['operations'],
+                                                          options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            rows = compare_results(baseline['results'], report['results'], options['threshold'])
+            for scale, name, old_ms, new_ms, ratio, regression in rows:
+                self.stderr.write('%-7s %-55s %10.3f %10.3f %6.2fx%s' % (
+                    scale, name, old_ms, new_ms, ratio, '  РЕГРЕССИЯ' if regression else ''))
+            if any(row[-1] for row in rows):
+                raise CommandError('Есть замеры медленнее базового запуска более чем в %s раза' % options['threshold'])
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from bookHouse.benchmark import SCALES, generate_library, bench_mixed_load
+
+# (имя, замена параметров соединения из DATABASES, режим журнала файла БД). default - Django без настроек:
+# журнал отката, новое соединение на запрос, отложенные транзакции; tuned - DATABASES как есть
+CONFIGURATIONS = [
+    ('default', {'CONN_MAX_AGE': 0, 'OPTIONS': {}}, 'DELETE'),
+    ('tuned', {}, settings.SQLITE_PRAGMAS['journal_mode']),
+]
+
+
+class Command(BaseCommand):
+    help = ('Смешанная нагрузка чтение/запись через ORM на временной тестовой БД из DATABASES: '
+            'параметры соединения SQLite по умолчанию против настроенных OPTIONS и постоянных соединений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--scale', default='small', choices=list(SCALES))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер настроек SQLite, а в DATABASES указана %s' % connection.vendor)
+        scale = SCALES[options['scale']]
+        if options['threads'] > scale['readers']:
+            raise CommandError('Потоков больше, чем читателей в размере %s' % options['scale'])
+
+        # соединения потоков создаются из этого словаря, поэтому настройки меняются в нем и восстанавливаются
+        database = connections.settings['default']
+        configured = {key: database[key] for key in ('CONN_MAX_AGE', 'OPTIONS')}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write('%-8s %10s %10s %8s %10s' % ('config', 'reads/s', 'writes/s', 'errors', 'ops/s'))
+        try:
+            for name, overrides, journal_mode in CONFIGURATIONS:
+                connections.close_all()
+                database.update(configured, **overrides)
+                call_command('flush', interactive=False, verbosity=0)
+                generate_library(**scale)
+                # режим журнала хранится в файле БД, его переключают при единственном соединении
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode=%s' % journal_mode)
+                connection.close()
+
+                counts = bench_mixed_load(options['threads'], options['seconds'], options['write_ratio'])
+                seconds = options['seconds']
+                self.stdout.write('%-8s %10.0f %10.0f %8d %10.0f' % (
+                    name, counts['reads'] / seconds, counts['writes'] / seconds, counts['errors'],
+                    (counts['reads'] + counts['writes']) / seconds))
+        finally:
+            connections.close_all()
+            database.update(configured)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from bookHouse.export import stream_export, EXPORT_COLUMNS, EXPORT_FORMATS
+from bookHouse.management.arguments import datetime_argument
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка журнала перемещений, каталога книг или читателей в CSV/NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORT_COLUMNS))
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--date-from', type=datetime_argument, help='Начало периода (журнал), ISO 8601')
+        parser.add_argument('--date-to', type=datetime_argument, help='Конец периода (журнал), ISO 8601, не включая')
+        parser.add_argument('--output', help='Файл выгрузки, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        chunks = stream_export(options['name'], options['format'], options['date_from'], options['date_to'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
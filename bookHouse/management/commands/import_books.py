@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookHouse.catalogue_import import import_books, READERS, IMPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Импортирует каталог книг из JSON Lines или CSV в формате BookSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='По умолчанию определяется по расширению')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError('Неизвестный формат файла: %s' % file_format)
+
+        with open(options['path'], encoding='utf-8', newline='') as file:
+            result = import_books(READERS[file_format](file), chunk_size=options['chunk_size'])
+
+        for error in result['errors']:
+            self.stderr.write('Строка %s: %s' % (error['line'], error['errors']))
+        self.stdout.write('Импортировано книг: %s, ошибок: %s' % (result['created'], len(result['errors'])))
@@ -0,0 +1,70 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def fetch(url, timeout):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, parts.port or 80), timeout)
+    try:
+        writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nAccept: application/json\r\nConnection: close\r\n\r\n'
+                      % (path or '/', parts.netloc)).encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def run_load(url, concurrency, requests, timeout):
+    latencies = []
+    errors = 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            started = time.perf_counter()
+            try:
+                status = await fetch(url, timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status = None
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест чтения: одновременные GET-запросы к запущенным серверам, '
+            'например синхронному (gunicorn library.wsgi) и асинхронному (uvicorn library.asgi) развертыванию')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Адреса для сравнения, например http://127.0.0.1:8000/books/ '
+                                                    'и http://127.0.0.1:8001/async/books/')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('Число клиентов и запросов должно быть положительным')
+
+        self.stdout.write('%-50s %8s %8s %9s %9s %9s' % ('url', 'ok', 'errors', 'rps', 'p50, мс', 'p95, мс'))
+        for url in options['urls']:
+            latencies, errors, elapsed = asyncio.run(
+                run_load(url, options['concurrency'], options['requests'], options['timeout']))
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000 if latencies else 0
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0
+            self.stdout.write('%-50s %8d %8d %9.1f %9.1f %9.1f' % (
+                url, len(latencies), errors, len(latencies) / elapsed, p50, p95))
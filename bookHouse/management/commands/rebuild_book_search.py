@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from bookHouse.search import rebuild_book_search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс каталога книг'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_book_search()
+        self.stdout.write('Индекс поиска перестроен')
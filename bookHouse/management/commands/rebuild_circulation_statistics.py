@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from bookHouse.models import rebuild_circulation_statistics, BookStatistics, ReaderStatistics
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику выдач книг и книг на руках у читателей по журналу'
+
+    def handle(self, *args, **options):
+        rebuild_circulation_statistics()
+        self.stdout.write('Книг: %s, читателей: %s' % (BookStatistics.objects.count(),
+                                                       ReaderStatistics.objects.count()))
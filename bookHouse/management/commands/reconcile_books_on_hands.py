@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bookHouse.models import reconcile_books_on_hands
+
+
+class Command(BaseCommand):
+    help = 'Сверяет таблицу книг на руках с журналом перемещения/выдачи/приема и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        result = reconcile_books_on_hands(dry_run=options['dry_run'])
+        self.stdout.write('Нет в таблице: %s, лишние: %s, другой читатель: %s' % (
+            len(result['missing']), len(result['stale']), len(result['changed'])))
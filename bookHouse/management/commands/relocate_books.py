@@ -0,0 +1,42 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from bookHouse.models import BookShelf, BookCase, BookHall, Librarian, relocate_books
+
+SCOPES = {'shelf': BookShelf, 'case': BookCase, 'hall': BookHall}
+
+
+def get_scope(value):
+    kind, _, pk = value.partition(':')
+    if kind not in SCOPES or not pk.isdigit():
+        raise CommandError('Область задается как shelf:<id>, case:<id> или hall:<id>, получено "%s"' % value)
+    try:
+        return SCOPES[kind].objects.get(pk=pk)
+    except SCOPES[kind].DoesNotExist:
+        raise CommandError('Не найдено: %s' % value)
+
+
+class Command(BaseCommand):
+    help = 'Переносит книги с полок источника на свободные полки назначения одной транзакцией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Откуда: shelf:<id>, case:<id> или hall:<id>')
+        parser.add_argument('target', help='Куда: shelf:<id>, case:<id> или hall:<id>')
+        parser.add_argument('--librarian', required=True, help='Ф.И.О. библиотекаря для журнала')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать план переноса')
+
+    def handle(self, *args, **options):
+        try:
+            librarian = Librarian.objects.get(fio=options['librarian'])
+        except Librarian.DoesNotExist:
+            raise CommandError('Библиотекарь "%s" не найден' % options['librarian'])
+        try:
+            moves = relocate_books(get_scope(options['source']), get_scope(options['target']), librarian,
+                                   dry_run=options['dry_run'])
+        except ValidationError as error:
+            raise CommandError(' '.join(error.messages))
+
+        if options['verbosity'] > 1:
+            for move in moves:
+                self.stdout.write('%(book)s: %(from_book_shelf)s -> %(to_book_shelf)s' % move)
+        self.stdout.write('%s книг: %s' % ('Будет перенесено' if options['dry_run'] else 'Перенесено', len(moves)))
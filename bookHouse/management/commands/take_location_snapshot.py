@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from bookHouse.history import snapshot_due, take_location_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Снимок расстановки книг для восстановления истории; запускается по расписанию, '
+            'снимок делается, если с прошлого прошло LOCATION_SNAPSHOTS["INTERVAL_DAYS"]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Сделать снимок независимо от интервала')
+
+    def handle(self, *args, **options):
+        if not options['force'] and not snapshot_due():
+            self.stdout.write('Снимок не нужен: интервал еще не прошел')
+            return
+        snapshot = take_location_snapshot()
+        self.stdout.write('Снимок %s: книг %s, журнал до записи %s' % (
+            snapshot.pk, snapshot.entries.count(), snapshot.last_move_id))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0004_movebookjournal_returned'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.ManyToManyField(related_name='books', to='bookHouse.author'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='publication_type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='books', to='bookHouse.publicationtype'),
+        ),
+        migrations.AlterField(
+            model_name='bookcase',
+            name='book_hall',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='book_case', to='bookHouse.bookhall'),
+        ),
+        migrations.AlterField(
+            model_name='bookhall',
+            name='librarian',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='book_hall', to='bookHouse.librarian'),
+        ),
+        migrations.AlterField(
+            model_name='bookshelf',
+            name='book_case',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='book_shelf', to='bookHouse.bookcase'),
+        ),
+        migrations.AlterField(
+            model_name='movebookjournal',
+            name='date_time_move',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата перемещения/выдачи/сдачи'),
+        ),
+        migrations.AddIndex(
+            model_name='movebookjournal',
+            index=models.Index(fields=['date_time_move', 'id'], name='journal_move_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='librarian',
+            constraint=models.UniqueConstraint(fields=('fio',), name='Ф.И.О. должно быть уникальным'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_books_count(apps, schema_editor):
+    BookShelf = apps.get_model('bookHouse', 'BookShelf')
+    Book = apps.get_model('bookHouse', 'Book')
+    books_count = Book.objects.filter(book_shelf=OuterRef('pk')).values('book_shelf').annotate(
+        cnt=Count('pk')).values('cnt')
+    BookShelf.objects.update(books_count=Coalesce(Subquery(books_count), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0005_movebookjournal_journal_move_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookshelf',
+            name='books_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество книг на полке'),
+        ),
+        migrations.RunPython(fill_books_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bookshelf',
+            index=models.Index(condition=models.Q(('books_count__lt', 10)), fields=['id'], name='shelf_free_idx'),
+        ),
+    ]
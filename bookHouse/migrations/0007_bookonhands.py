@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_books_on_hands(apps, schema_editor):
+    MoveBookJournal = apps.get_model('bookHouse', 'MoveBookJournal')
+    BookOnHands = apps.get_model('bookHouse', 'BookOnHands')
+    last_move = MoveBookJournal.objects.filter(book=OuterRef('book')).order_by('-date_time_move', '-id').values('id')[:1]
+    on_hands = MoveBookJournal.objects.filter(id=Subquery(last_move), to_book_shelf__isnull=True,
+                                              reader__isnull=False).values_list('book', 'reader')
+    BookOnHands.objects.bulk_create(BookOnHands(book_id=book_id, reader_id=reader_id)
+                                    for book_id, reader_id in on_hands)
+    # auto_now_add перезаписывает date_time_take в bulk_create, время выдачи из журнала ставится отдельным UPDATE
+    BookOnHands.objects.update(date_time_take=Subquery(
+        MoveBookJournal.objects.filter(book=OuterRef('book')).order_by('-date_time_move', '-id').values(
+            'date_time_move')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0006_bookshelf_books_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookOnHands',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='on_hands', serialize=False, to='bookHouse.book')),
+                ('date_time_take', models.DateTimeField(auto_now_add=True, verbose_name='Дата выдачи')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='books_on_hands', to='bookHouse.reader')),
+            ],
+            options={
+                'verbose_name': 'Книга на руках',
+            },
+        ),
+        migrations.RunPython(fill_books_on_hands, migrations.RunPython.noop),
+    ]
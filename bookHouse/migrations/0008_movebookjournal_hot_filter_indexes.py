@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0007_bookonhands'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movebookjournal',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['book', 'reader'], name='journal_open_loan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movebookjournal',
+            index=models.Index(fields=['book', 'to_book_shelf'], name='journal_book_shelf_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_statistics(apps, schema_editor):
+    MoveBookJournal = apps.get_model('bookHouse', 'MoveBookJournal')
+    BookOnHands = apps.get_model('bookHouse', 'BookOnHands')
+    BookStatistics = apps.get_model('bookHouse', 'BookStatistics')
+    ReaderStatistics = apps.get_model('bookHouse', 'ReaderStatistics')
+
+    take_counts = MoveBookJournal.objects.filter(to_book_shelf__isnull=True).values_list('book').annotate(
+        count=Count('id')).order_by()
+    BookStatistics.objects.bulk_create(
+        [BookStatistics(book_id=book_id, take_count=count) for book_id, count in take_counts], batch_size=1000)
+
+    on_hands = BookOnHands.objects.values_list('reader').annotate(count=Count('book')).order_by()
+    ReaderStatistics.objects.bulk_create(
+        [ReaderStatistics(reader_id=reader_id, books_on_hands=count) for reader_id, count in on_hands],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0008_movebookjournal_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStatistics',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='bookHouse.book')),
+                ('take_count', models.PositiveIntegerField(default=0, verbose_name='Количество выдач')),
+            ],
+            options={
+                'verbose_name': 'Статистика выдач книги',
+                'indexes': [models.Index(fields=['-take_count'], name='book_stat_take_count_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReaderStatistics',
+            fields=[
+                ('reader', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='bookHouse.reader')),
+                ('books_on_hands', models.PositiveIntegerField(default=0, verbose_name='Книг на руках')),
+            ],
+            options={
+                'verbose_name': 'Статистика читателя',
+                'indexes': [models.Index(condition=models.Q(('books_on_hands__gt', 0)), fields=['reader'], name='reader_stat_on_hands_idx')],
+            },
+        ),
+        migrations.RunPython(fill_statistics, migrations.RunPython.noop),
+    ]
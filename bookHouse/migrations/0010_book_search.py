@@ -0,0 +1,65 @@
+from django.db import migrations
+
+AUTHORS_SQL = '''
+    (SELECT group_concat(a.fio, ' ') FROM "bookHouse_book_author" ba
+     INNER JOIN "bookHouse_author" a ON a.id = ba.author_id WHERE ba.book_id = %s)
+'''
+
+CREATE_SQL = [
+    '''CREATE VIRTUAL TABLE "bookHouse_book_search" USING fts5(
+        name, description, authors, tokenize = 'unicode61 remove_diacritics 2')''',
+    '''CREATE TRIGGER "bookHouse_book_search_ai" AFTER INSERT ON "bookHouse_book" BEGIN
+        INSERT INTO "bookHouse_book_search" (rowid, name, description, authors)
+        VALUES (new.id, new.name, new.description, '');
+    END''',
+    '''CREATE TRIGGER "bookHouse_book_search_au" AFTER UPDATE OF name, description ON "bookHouse_book" BEGIN
+        UPDATE "bookHouse_book_search" SET name = new.name, description = new.description WHERE rowid = new.id;
+    END''',
+    '''CREATE TRIGGER "bookHouse_book_search_ad" AFTER DELETE ON "bookHouse_book" BEGIN
+        DELETE FROM "bookHouse_book_search" WHERE rowid = old.id;
+    END''',
+    '''CREATE TRIGGER "bookHouse_book_author_search_ai" AFTER INSERT ON "bookHouse_book_author" BEGIN
+        UPDATE "bookHouse_book_search" SET authors = coalesce(%s, '') WHERE rowid = new.book_id;
+    END''' % (AUTHORS_SQL % 'new.book_id'),
+    '''CREATE TRIGGER "bookHouse_book_author_search_ad" AFTER DELETE ON "bookHouse_book_author" BEGIN
+        UPDATE "bookHouse_book_search" SET authors = coalesce(%s, '') WHERE rowid = old.book_id;
+    END''' % (AUTHORS_SQL % 'old.book_id'),
+    '''CREATE TRIGGER "bookHouse_author_search_au" AFTER UPDATE OF fio ON "bookHouse_author" BEGIN
+        UPDATE "bookHouse_book_search" SET authors = coalesce(%s, '')
+        WHERE rowid IN (SELECT book_id FROM "bookHouse_book_author" WHERE author_id = new.id);
+    END''' % (AUTHORS_SQL % '"bookHouse_book_search".rowid'),
+    '''INSERT INTO "bookHouse_book_search" (rowid, name, description, authors)
+        SELECT b.id, b.name, b.description, coalesce(%s, '') FROM "bookHouse_book" b''' % (AUTHORS_SQL % 'b.id'),
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS "bookHouse_author_search_au"',
+    'DROP TRIGGER IF EXISTS "bookHouse_book_author_search_ad"',
+    'DROP TRIGGER IF EXISTS "bookHouse_book_author_search_ai"',
+    'DROP TRIGGER IF EXISTS "bookHouse_book_search_ad"',
+    'DROP TRIGGER IF EXISTS "bookHouse_book_search_au"',
+    'DROP TRIGGER IF EXISTS "bookHouse_book_search_ai"',
+    'DROP TABLE IF EXISTS "bookHouse_book_search"',
+]
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        # полнотекстовый индекс FTS5 есть только в SQLite
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql, params=None)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0009_circulation_statistics'),
+    ]
+
+    operations = [
+        migrations.RunPython(execute(CREATE_SQL), execute(DROP_SQL)),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+VERSIONED_TABLES = [
+    'bookHouse_author',
+    'bookHouse_publicationtype',
+    'bookHouse_librarian',
+    'bookHouse_bookhall',
+    'bookHouse_bookcase',
+    'bookHouse_bookshelf',
+    'bookHouse_reader',
+    'bookHouse_book',
+    'bookHouse_book_author',
+    'bookHouse_movebookjournal',
+    'bookHouse_bookonhands',
+    'bookHouse_bookstatistics',
+    'bookHouse_readerstatistics',
+]
+
+OPERATIONS = ['INSERT', 'UPDATE', 'DELETE']
+
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+TRIGGER_SQL = '''
+    CREATE TRIGGER "%(table)s_version_%(name)s" AFTER %(operation)s ON "%(table)s" BEGIN
+        INSERT INTO "bookHouse_tableversion" (name, version, modified) VALUES ('%(table)s', 1, %(now)s)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1, modified = excluded.modified;
+    END
+'''
+
+
+def create_triggers(apps, schema_editor):
+    # версии таблиц ведут триггеры, поэтому учитываются и update()/bulk_create в обход сигналов
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in VERSIONED_TABLES:
+        schema_editor.execute(
+            'INSERT INTO "bookHouse_tableversion" (name, version, modified) VALUES (\'%s\', 0, %s)' % (table, NOW_SQL),
+            params=None)
+        for operation in OPERATIONS:
+            schema_editor.execute(TRIGGER_SQL % {'table': table, 'name': operation.lower(), 'operation': operation,
+                                                 'now': NOW_SQL}, params=None)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in VERSIONED_TABLES:
+        for operation in OPERATIONS:
+            schema_editor.execute('DROP TRIGGER IF EXISTS "%s_version_%s"' % (table, operation.lower()), params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0010_book_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+                ('modified', models.DateTimeField(verbose_name='Изменена')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы',
+            },
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
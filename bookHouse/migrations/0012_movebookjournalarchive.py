@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0011_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoveBookJournalArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date_time_move', models.DateTimeField(verbose_name='Дата перемещения/выдачи/сдачи')),
+                ('outside_the_library', models.BooleanField(default=False, verbose_name='Выдача на дом')),
+                ('returned', models.BooleanField(default=False, verbose_name='Книга возвращена')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bookHouse.book')),
+                ('from_book_shelf', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bookHouse.bookshelf', verbose_name='Откуда переместили')),
+                ('librarian', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bookHouse.librarian', verbose_name='Библиотекарь внесший перемещение/выдачу/прием книги')),
+                ('reader', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bookHouse.reader')),
+                ('to_book_shelf', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bookHouse.bookshelf', verbose_name='Куда переместили')),
+            ],
+            options={
+                'verbose_name': 'Архив журнала перемещения/выдачи/приема',
+                'indexes': [models.Index(fields=['date_time_move', 'id'], name='journal_archive_date_idx'), models.Index(fields=['book', 'to_book_shelf'], name='journal_archive_book_shelf_idx')],
+            },
+        ),
+    ]
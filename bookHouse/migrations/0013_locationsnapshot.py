@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0012_movebookjournalarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True, verbose_name='Дата снимка')),
+                ('last_move_id', models.BigIntegerField(verbose_name='Последняя учтенная запись журнала')),
+            ],
+            options={
+                'verbose_name': 'Снимок расстановки книг',
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationSnapshotEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookHouse.book')),
+                ('book_shelf', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bookHouse.bookshelf', verbose_name='Полка')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='bookHouse.locationsnapshot')),
+            ],
+            options={
+                'verbose_name': 'Место книги в снимке',
+                'indexes': [models.Index(fields=['snapshot', 'book_shelf'], name='snapshot_entry_shelf_idx')],
+            },
+        ),
+    ]
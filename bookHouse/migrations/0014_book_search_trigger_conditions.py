@@ -0,0 +1,49 @@
+from django.db import migrations
+
+AUTHORS_SQL = '''
+    (SELECT group_concat(a.fio, ' ') FROM "bookHouse_book_author" ba
+     INNER JOIN "bookHouse_author" a ON a.id = ba.author_id WHERE ba.book_id = %s)
+'''
+
+
+def triggers(book_condition, author_condition):
+    # save() пишет все колонки, и UPDATE OF срабатывает на каждую выдачу и возврат;
+    # WHEN пропускает обновления, в которых индексируемые поля не изменились
+    return [
+        'DROP TRIGGER IF EXISTS "bookHouse_book_search_au"',
+        'DROP TRIGGER IF EXISTS "bookHouse_author_search_au"',
+        '''CREATE TRIGGER "bookHouse_book_search_au" AFTER UPDATE OF name, description ON "bookHouse_book"
+        %s BEGIN
+            UPDATE "bookHouse_book_search" SET name = new.name, description = new.description WHERE rowid = new.id;
+        END''' % book_condition,
+        '''CREATE TRIGGER "bookHouse_author_search_au" AFTER UPDATE OF fio ON "bookHouse_author" %s BEGIN
+            UPDATE "bookHouse_book_search" SET authors = coalesce(%s, '')
+            WHERE rowid IN (SELECT book_id FROM "bookHouse_book_author" WHERE author_id = new.id);
+        END''' % (author_condition, AUTHORS_SQL % '"bookHouse_book_search".rowid'),
+    ]
+
+
+CREATE_SQL = triggers('WHEN old.name IS NOT new.name OR old.description IS NOT new.description',
+                      'WHEN old.fio IS NOT new.fio')
+DROP_SQL = triggers('', '')
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql, params=None)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0013_locationsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(execute(CREATE_SQL), execute(DROP_SQL)),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_from_book_shelf(apps, schema_editor):
+    # выдачи до атомарного оборота писались без from_book_shelf; полка выдачи - та, куда книгу поставило
+    # предыдущее перемещение. Выдача, с которой начинается история книги, остается без полки: ее не восстановить
+    MoveBookJournal = apps.get_model('bookHouse', 'MoveBookJournal')
+    MoveBookJournalArchive = apps.get_model('bookHouse', 'MoveBookJournalArchive')
+
+    def previous_shelf(journal):
+        return Subquery(journal.objects.filter(book=OuterRef('book'), id__lt=OuterRef('id')).order_by('-id').values(
+            'to_book_shelf')[:1])
+
+    # архив старше журнала, поэтому у архивной записи предыдущая тоже в архиве
+    MoveBookJournalArchive.objects.filter(from_book_shelf__isnull=True, to_book_shelf__isnull=True).update(
+        from_book_shelf=previous_shelf(MoveBookJournalArchive))
+    MoveBookJournal.objects.filter(from_book_shelf__isnull=True, to_book_shelf__isnull=True).update(
+        from_book_shelf=Coalesce(previous_shelf(MoveBookJournal), previous_shelf(MoveBookJournalArchive)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0014_book_search_trigger_conditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_from_book_shelf, migrations.RunPython.noop),
+    ]
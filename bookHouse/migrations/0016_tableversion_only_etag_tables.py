@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# ETag собирается только из таблиц version_models представлений. Оборот книг пишет еще в
+# BookOnHands и статистику - их версии никто не читает, а триггеры на них лишь удлиняли транзакцию выдачи
+UNVERSIONED_TABLES = [
+    'bookHouse_bookonhands',
+    'bookHouse_bookstatistics',
+    'bookHouse_readerstatistics',
+]
+
+OPERATIONS = ['INSERT', 'UPDATE', 'DELETE']
+
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+TRIGGER_SQL = '''
+    CREATE TRIGGER "%(table)s_version_%(name)s" AFTER %(operation)s ON "%(table)s" BEGIN
+        INSERT INTO "bookHouse_tableversion" (name, version, modified) VALUES ('%(table)s', 1, %(now)s)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1, modified = excluded.modified;
+    END
+'''
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in UNVERSIONED_TABLES:
+        for operation in OPERATIONS:
+            schema_editor.execute('DROP TRIGGER IF EXISTS "%s_version_%s"' % (table, operation.lower()), params=None)
+    apps.get_model('bookHouse', 'TableVersion').objects.filter(name__in=UNVERSIONED_TABLES).delete()
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in UNVERSIONED_TABLES:
+        schema_editor.execute(
+            'INSERT INTO "bookHouse_tableversion" (name, version, modified) VALUES (\'%s\', 0, %s)' % (table, NOW_SQL),
+            params=None)
+        for operation in OPERATIONS:
+            schema_editor.execute(TRIGGER_SQL % {'table': table, 'name': operation.lower(), 'operation': operation,
+                                                 'now': NOW_SQL}, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0015_fill_journal_from_book_shelf'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+    ]
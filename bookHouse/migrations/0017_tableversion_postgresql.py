@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# те же версии таблиц для ETag на PostgreSQL. Триггер уровня оператора: массовый update() или bulk_create
+# поднимает версию один раз, а не на каждую строку
+VERSIONED_TABLES = [
+    'bookHouse_author',
+    'bookHouse_publicationtype',
+    'bookHouse_librarian',
+    'bookHouse_bookhall',
+    'bookHouse_bookcase',
+    'bookHouse_bookshelf',
+    'bookHouse_reader',
+    'bookHouse_book',
+    'bookHouse_book_author',
+    'bookHouse_movebookjournal',
+]
+
+FUNCTION_SQL = '''
+    CREATE OR REPLACE FUNCTION "bookHouse_table_version"() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO "bookHouse_tableversion" (name, version, modified) VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+        ON CONFLICT (name) DO UPDATE SET version = "bookHouse_tableversion".version + 1,
+                                         modified = excluded.modified;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+TRIGGER_SQL = '''
+    CREATE TRIGGER "%(table)s_version" AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "%(table)s"
+    FOR EACH STATEMENT EXECUTE FUNCTION "bookHouse_table_version"()
+'''
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(FUNCTION_SQL, params=None)
+    for table in VERSIONED_TABLES:
+        schema_editor.execute(
+            'INSERT INTO "bookHouse_tableversion" (name, version, modified) VALUES (\'%s\', 0, clock_timestamp()) '
+            'ON CONFLICT (name) DO NOTHING' % table, params=None)
+        schema_editor.execute(TRIGGER_SQL % {'table': table}, params=None)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in VERSIONED_TABLES:
+        schema_editor.execute('DROP TRIGGER IF EXISTS "%s_version" ON "%s"' % (table, table), params=None)
+    schema_editor.execute('DROP FUNCTION IF EXISTS "bookHouse_table_version"()', params=None)
+    apps.get_model('bookHouse', 'TableVersion').objects.filter(name__in=VERSIONED_TABLES).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookHouse', '0016_tableversion_only_etag_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -1,10 +1,18 @@
 import datetime
+import itertools
+from collections import Counter, defaultdict
 
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Count, OuterRef, Subquery, Aggregate, CharField
+from django.db import models, transaction
+from django.db.models import (Count, OuterRef, Subquery, Aggregate, CharField, TextField, Exists, F, Q, Value, Case,
+                              When)
+from django.db.models.functions import Cast, Concat
+
+from bookHouse.transactions import atomic_with_retry
 
 MAX_BOOKS_ON_SHELF = 10
+MAX_BOOKS_ON_HANDS = 3
+BOOKS_ON_HANDS_LIMIT_ERROR = "На руках уже максимум книг (%s), больше выдать нельзя." % MAX_BOOKS_ON_HANDS
 
 
 class Author(models.Model):
@@ -68,6 +76,7 @@ class BookCase(models.Model):
 class BookShelf(models.Model):
     number = models.PositiveIntegerField('Номер полки')
     book_case = models.ForeignKey(BookCase, on_delete=models.PROTECT, related_name='book_shelf')
+    books_count = models.PositiveIntegerField('Количество книг на полке', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Полка'
@@ -75,12 +84,20 @@ class BookShelf(models.Model):
             models.UniqueConstraint(fields=['number', 'book_case'],
                                     name='Номер полки должен быть уникален в рамках стеллажа')
         ]
+        indexes = [
+            # частичный индекс по полкам со свободным местом: поиск первой свободной полки без GROUP BY
+            models.Index(fields=['id'], condition=Q(books_count__lt=MAX_BOOKS_ON_SHELF), name='shelf_free_idx'),
+        ]
 
     def __str__(self):
         return ''.join(['Номер полки: ' + str(self.number) + ' (Стеллаж: ' + str(
             self.book_case.number) + ')' + ' (Зал: ' + str(self.book_case.book_hall.name) + ')'])
 
 
+class ShelfIsFull(ValidationError):
+    pass
+
+
 class Reader(models.Model):
     fio = models.CharField('Ф.И.О.', max_length=200)
 
@@ -109,40 +126,91 @@ class Book(models.Model):
         ]
 
     def __str__(self):
+        if self.publication_type_id is None:
+            return self.name
         return ''.join([self.name + ' (', self.publication_type.name, ')'])
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous_shelf_id = None
+            if self.pk is not None:
+                previous_shelf_id = Book.objects.filter(pk=self.pk).values_list('book_shelf_id', flat=True).first()
+
+            if previous_shelf_id != self.book_shelf_id:
+                # занимаем место условным UPDATE, чтобы параллельные сохранения не переполнили полку
+                if self.book_shelf_id is not None and not BookShelf.objects.filter(
+                        pk=self.book_shelf_id, books_count__lt=MAX_BOOKS_ON_SHELF).update(
+                        books_count=F('books_count') + 1):
+                    raise ShelfIsFull("Полка заполнена")
+                if previous_shelf_id is not None:
+                    BookShelf.objects.filter(pk=previous_shelf_id).update(books_count=F('books_count') - 1)
+
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.book_shelf_id is not None:
+                BookShelf.objects.filter(pk=self.book_shelf_id).update(books_count=F('books_count') - 1)
+            return super().delete(*args, **kwargs)
+
     def give_first_shelf_book(self) -> BookShelf:
-        return BookShelf.objects.annotate(books_count=Count('books')).filter(books_count__lt=MAX_BOOKS_ON_SHELF).first()
+        return BookShelf.objects.filter(books_count__lt=MAX_BOOKS_ON_SHELF).order_by('id').first()
 
+    @atomic_with_retry
     def return_to_library(self, reader: Reader, librarian: Librarian):
-        shelf = self.give_first_shelf_book()
+        book = Book.objects.select_for_update().get(pk=self.pk)
 
-        if shelf is None:
-            raise ValidationError("Полки закончились")
+        if book.book_shelf_id is not None:
+            raise ValidationError("Книга уже находится в библиотеке.")
 
-        self.book_shelf = shelf
-        MoveBookJournal.objects.filter(reader=reader, outside_the_library=True, book=self,
+        while True:
+            shelf = book.give_first_shelf_book()
+
+            if shelf is None:
+                raise ValidationError("Полки закончились")
+
+            book.book_shelf = shelf
+            try:
+                book.save()
+            except ShelfIsFull:
+                # полку успели занять параллельно, берем следующую свободную
+                continue
+            break
+
+        MoveBookJournal.objects.filter(reader=reader, outside_the_library=True, book=book,
                                        returned=False).update(returned=True)
-        self.save()
 
-        MoveBookJournal.objects.create(book=self, reader=reader, to_book_shelf=shelf,
+        MoveBookJournal.objects.create(book=book, reader=reader, to_book_shelf=shelf,
                                        date_time_move=datetime.datetime.now(),
                                        librarian=librarian, returned=True)
+        on_hands = BookOnHands.objects.filter(book=book).values_list('reader', flat=True).first()
+        if on_hands is not None:
+            BookOnHands.objects.filter(book=book).delete()
+            _add_reader_books_on_hands({on_hands: -1})
+        self.book_shelf = shelf
 
-    def take_on_hands(self, reader: Reader, librarian: Librarian, in_library):
-        if self.book_shelf == None:
+    @atomic_with_retry
+    def take_on_hands(self, reader: Reader, librarian: Librarian):
+        book = Book.objects.select_for_update().get(pk=self.pk)
+
+        if book.book_shelf_id is None:
             raise ValidationError("Невозможно выдать книгу. Книга уже выдана другому читателю.")
 
-        if MoveBookJournal.objects.filter(reader=reader, outside_the_library=in_library, book=self,
-                                          returned=False).count() > 3:
-            raise ValidationError("На руках больше 3-х книг.")
+        if BookOnHands.objects.filter(reader=reader).count() >= MAX_BOOKS_ON_HANDS:
+            raise ValidationError(BOOKS_ON_HANDS_LIMIT_ERROR)
 
-        self.book_shelf = None
-        self.save()
+        from_book_shelf_id = book.book_shelf_id
+        book.book_shelf = None
+        book.save()
 
-        MoveBookJournal.objects.create(book=self, reader=reader, outside_the_library=True,
+        MoveBookJournal.objects.create(book=book, reader=reader, outside_the_library=True,
+                                       from_book_shelf_id=from_book_shelf_id,
                                        date_time_move=datetime.datetime.now(),
                                        librarian=librarian)
+        BookOnHands.objects.create(book=book, reader=reader)
+        _add_book_takes([book.pk])
+        _add_reader_books_on_hands({reader.pk: 1})
+        self.book_shelf = None
 
 
 class MoveBookJournal(models.Model):
@@ -160,6 +228,331 @@ class MoveBookJournal(models.Model):
 
     class Meta:
         verbose_name = 'Журнал перемещения/выдачи/приема'
+        indexes = [
+            models.Index(fields=['date_time_move', 'id'], name='journal_move_date_idx'),
+            # незакрытые выдачи: закрытие в return_to_library, count_book_on_hands_by_readers
+            models.Index(fields=['book', 'reader'], condition=Q(returned=False), name='journal_open_loan_idx'),
+            # история полок книги: get_move_book_journal_shelves_by_book
+            models.Index(fields=['book', 'to_book_shelf'], name='journal_book_shelf_idx'),
+        ]
+
+
+class MoveBookJournalArchive(models.Model):
+    # закрытые записи журнала старше горизонта архивации (bookHouse/archive.py), id сохраняется из журнала
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.PROTECT, related_name='+')
+    from_book_shelf = models.ForeignKey(BookShelf, verbose_name='Откуда переместили', on_delete=models.PROTECT,
+                                        null=True, related_name='+')
+    to_book_shelf = models.ForeignKey(BookShelf, verbose_name='Куда переместили', on_delete=models.PROTECT, null=True,
+                                      related_name='+')
+    date_time_move = models.DateTimeField('Дата перемещения/выдачи/сдачи')
+    librarian = models.ForeignKey(Librarian, verbose_name="Библиотекарь внесший перемещение/выдачу/прием книги",
+                                  on_delete=models.PROTECT, related_name='+')
+    reader = models.ForeignKey(Reader, on_delete=models.PROTECT, null=True, related_name='+')
+    outside_the_library = models.BooleanField('Выдача на дом', default=False)
+    returned = models.BooleanField('Книга возвращена', default=False)
+    archived_at = models.DateTimeField('Дата архивации', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Архив журнала перемещения/выдачи/приема'
+        indexes = [
+            models.Index(fields=['date_time_move', 'id'], name='journal_archive_date_idx'),
+            models.Index(fields=['book', 'to_book_shelf'], name='journal_archive_book_shelf_idx'),
+        ]
+
+
+class LocationSnapshot(models.Model):
+    # расстановка книг после записи журнала last_move_id, от нее история восстанавливается в обе стороны
+    taken_at = models.DateTimeField('Дата снимка', db_index=True)
+    last_move_id = models.BigIntegerField('Последняя учтенная запись журнала')
+
+    class Meta:
+        verbose_name = 'Снимок расстановки книг'
+
+
+class LocationSnapshotEntry(models.Model):
+    snapshot = models.ForeignKey(LocationSnapshot, on_delete=models.CASCADE, related_name='entries')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    book_shelf = models.ForeignKey(BookShelf, verbose_name='Полка', on_delete=models.PROTECT, null=True,
+                                   related_name='+')
+
+    class Meta:
+        verbose_name = 'Место книги в снимке'
+        indexes = [
+            models.Index(fields=['snapshot', 'book_shelf'], name='snapshot_entry_shelf_idx'),
+        ]
+
+
+class BookOnHands(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.PROTECT, primary_key=True, related_name='on_hands')
+    reader = models.ForeignKey(Reader, on_delete=models.PROTECT, related_name='books_on_hands')
+    date_time_take = models.DateTimeField('Дата выдачи', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Книга на руках'
+
+
+class BookStatistics(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    take_count = models.PositiveIntegerField('Количество выдач', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика выдач книги'
+        indexes = [
+            models.Index(fields=['-take_count'], name='book_stat_take_count_idx'),
+        ]
+
+
+class ReaderStatistics(models.Model):
+    reader = models.OneToOneField(Reader, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    books_on_hands = models.PositiveIntegerField('Книг на руках', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика читателя'
+        indexes = [
+            models.Index(fields=['reader'], condition=Q(books_on_hands__gt=0), name='reader_stat_on_hands_idx'),
+        ]
+
+
+def _add_book_takes(book_ids):
+    if not book_ids:
+        return
+    # строки создаются заранее, чтобы счетчик всегда менялся атомарным UPDATE
+    BookStatistics.objects.bulk_create([BookStatistics(book_id=book_id) for book_id in book_ids],
+                                       ignore_conflicts=True)
+    BookStatistics.objects.filter(book__in=book_ids).update(take_count=F('take_count') + 1)
+
+
+def _add_reader_books_on_hands(deltas):
+    deltas = {reader_id: delta for reader_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ReaderStatistics.objects.bulk_create([ReaderStatistics(reader_id=reader_id) for reader_id in deltas],
+                                         ignore_conflicts=True)
+    for reader_id, delta in deltas.items():
+        ReaderStatistics.objects.filter(reader=reader_id).update(books_on_hands=F('books_on_hands') + delta)
+
+
+@atomic_with_retry
+def rebuild_circulation_statistics():
+    # выдачи считаются за всю историю, вместе с архивом журнала
+    take_counts = Counter()
+    for journal in (MoveBookJournal, MoveBookJournalArchive):
+        take_counts.update(dict(journal.objects.filter(to_book_shelf__isnull=True).values_list('book').annotate(
+            count=Count('id')).order_by()))
+    BookStatistics.objects.all().delete()
+    BookStatistics.objects.bulk_create(
+        [BookStatistics(book_id=book_id, take_count=count) for book_id, count in take_counts.items()],
+        batch_size=1000)
+
+    on_hands = Counter(get_books_on_hands_from_journal().values())
+    ReaderStatistics.objects.all().delete()
+    ReaderStatistics.objects.bulk_create(
+        [ReaderStatistics(reader_id=reader_id, books_on_hands=count) for reader_id, count in on_hands.items()],
+        batch_size=1000)
+
+
+def get_books_on_hands_from_journal():
+    # книга на руках, если последняя запись журнала по ней - выдача читателю;
+    # последняя запись книги и незакрытые выдачи не архивируются, архив здесь не нужен
+    last_move = MoveBookJournal.objects.filter(book=OuterRef('book')).order_by('-date_time_move', '-id').values(
+        'id')[:1]
+    return dict(MoveBookJournal.objects.filter(id=Subquery(last_move), to_book_shelf__isnull=True,
+                                               reader__isnull=False).values_list('book', 'reader'))
+
+
+@atomic_with_retry
+def reconcile_books_on_hands(dry_run=False):
+    expected = get_books_on_hands_from_journal()
+    actual = dict(BookOnHands.objects.values_list('book', 'reader'))
+
+    missing = [book_id for book_id in expected if book_id not in actual]
+    stale = [book_id for book_id in actual if book_id not in expected]
+    changed = [book_id for book_id in expected if book_id in actual and actual[book_id] != expected[book_id]]
+
+    if not dry_run:
+        BookOnHands.objects.filter(book__in=stale).delete()
+        for book_id in changed:
+            BookOnHands.objects.filter(book=book_id).update(reader=expected[book_id])
+        BookOnHands.objects.bulk_create(BookOnHands(book_id=book_id, reader_id=expected[book_id])
+                                        for book_id in missing)
+        # счетчики читателей, чьи книги на руках поменялись, пересчитываются по исправленной таблице
+        readers = ({actual[book_id] for book_id in stale + changed} |
+                   {expected[book_id] for book_id in missing + changed})
+        _set_reader_books_on_hands(readers)
+
+    return {'missing': missing, 'stale': stale, 'changed': changed}
+
+
+def _set_reader_books_on_hands(reader_ids):
+    counts = dict(BookOnHands.objects.filter(reader__in=reader_ids).values_list('reader').annotate(
+        count=Count('book')).order_by())
+    ReaderStatistics.objects.bulk_create([ReaderStatistics(reader_id=reader_id) for reader_id in reader_ids],
+                                         ignore_conflicts=True)
+    for reader_id in reader_ids:
+        ReaderStatistics.objects.filter(reader=reader_id).update(books_on_hands=counts.get(reader_id, 0))
+
+
+def _circulation_result(number, error=None):
+    return {'number': number, 'success': error is None, 'error': error}
+
+
+def _lock_books_by_numbers(numbers, results):
+    books = {book.number: book for book in Book.objects.select_for_update().filter(number__in=numbers)}
+    for number in numbers:
+        if number not in books:
+            results[number] = _circulation_result(number, "Книга не найдена.")
+    return books
+
+
+@atomic_with_retry
+def take_books_on_hands(numbers, reader: Reader, librarian: Librarian):
+    numbers = list(dict.fromkeys(numbers))
+    results = {}
+    books = _lock_books_by_numbers(numbers, results)
+
+    on_hands = BookOnHands.objects.filter(reader=reader).count()
+
+    taken = []
+    for number, book in books.items():
+        if book.book_shelf_id is None:
+            results[number] = _circulation_result(number,
+                                                  "Невозможно выдать книгу. Книга уже выдана другому читателю.")
+        elif on_hands + len(taken) >= MAX_BOOKS_ON_HANDS:
+            results[number] = _circulation_result(number, BOOKS_ON_HANDS_LIMIT_ERROR)
+        else:
+            taken.append(book)
+            results[number] = _circulation_result(number)
+
+    released = Counter(book.book_shelf_id for book in taken)
+    for shelf_id, count in released.items():
+        BookShelf.objects.filter(pk=shelf_id).update(books_count=F('books_count') - count)
+    Book.objects.filter(pk__in=[book.pk for book in taken]).update(book_shelf=None)
+
+    MoveBookJournal.objects.bulk_create(
+        MoveBookJournal(book=book, reader=reader, outside_the_library=True, from_book_shelf_id=book.book_shelf_id,
+                        librarian=librarian) for book in taken)
+    BookOnHands.objects.bulk_create(BookOnHands(book=book, reader=reader) for book in taken)
+    _add_book_takes([book.pk for book in taken])
+    _add_reader_books_on_hands({reader.pk: len(taken)})
+
+    return [results[number] for number in numbers]
+
+
+@atomic_with_retry
+def return_books_to_library(numbers, reader: Reader, librarian: Librarian):
+    numbers = list(dict.fromkeys(numbers))
+    results = {}
+    books = _lock_books_by_numbers(numbers, results)
+
+    returned = []
+    for number, book in books.items():
+        if book.book_shelf_id is not None:
+            results[number] = _circulation_result(number, "Книга уже находится в библиотеке.")
+        else:
+            returned.append(book)
+
+    # раскладываем всю пачку по свободным полкам: на каждую книгу нужно не больше одной полки
+    placed = {}
+    free_shelves = BookShelf.objects.select_for_update().filter(books_count__lt=MAX_BOOKS_ON_SHELF).order_by(
+        'id').values_list('id', 'books_count')[:len(returned)]
+    books_to_place = iter(returned)
+    book = next(books_to_place, None)
+    for shelf_id, books_count in free_shelves:
+        while book is not None and books_count < MAX_BOOKS_ON_SHELF:
+            placed.setdefault(shelf_id, []).append(book)
+            books_count += 1
+            book = next(books_to_place, None)
+        if book is None:
+            break
+
+    for shelf_id, shelf_books in placed.items():
+        BookShelf.objects.filter(pk=shelf_id).update(books_count=F('books_count') + len(shelf_books))
+        Book.objects.filter(pk__in=[book.pk for book in shelf_books]).update(book_shelf=shelf_id)
+        for book in shelf_books:
+            book.book_shelf_id = shelf_id
+            results[book.number] = _circulation_result(book.number)
+
+    for book in returned:
+        if book.book_shelf_id is None:
+            results[book.number] = _circulation_result(book.number, "Полки закончились")
+
+    returned = [book for book in returned if book.book_shelf_id is not None]
+    MoveBookJournal.objects.filter(reader=reader, outside_the_library=True, book__in=returned,
+                                   returned=False).update(returned=True)
+    MoveBookJournal.objects.bulk_create(
+        MoveBookJournal(book=book, reader=reader, to_book_shelf_id=book.book_shelf_id, librarian=librarian,
+                        returned=True) for book in returned)
+    on_hands = Counter(BookOnHands.objects.filter(book__in=returned).values_list('reader', flat=True))
+    BookOnHands.objects.filter(book__in=returned).delete()
+    _add_reader_books_on_hands({reader_id: -count for reader_id, count in on_hands.items()})
+
+    return [results[number] for number in numbers]
+
+
+def _scope_shelves(scope):
+    # полка, все полки стеллажа или все полки зала
+    if isinstance(scope, BookShelf):
+        return BookShelf.objects.filter(pk=scope.pk)
+    if isinstance(scope, BookCase):
+        return BookShelf.objects.filter(book_case=scope)
+    if isinstance(scope, BookHall):
+        return BookShelf.objects.filter(book_case__book_hall=scope)
+    raise TypeError('Ожидается полка, стеллаж или зал, получено %r' % (scope,))
+
+
+@atomic_with_retry
+def relocate_books(source, target, librarian: Librarian, dry_run=False):
+    target_shelves = _scope_shelves(target)
+    books = list(Book.objects.select_for_update().filter(book_shelf__in=_scope_shelves(source)).exclude(
+        book_shelf__in=target_shelves).order_by('book_shelf', 'id').values_list('id', 'number', 'book_shelf'))
+    free_shelves = list(target_shelves.select_for_update(of=('self',)).filter(
+        books_count__lt=MAX_BOOKS_ON_SHELF).order_by('id').values_list('id', 'books_count'))
+
+    free = sum(MAX_BOOKS_ON_SHELF - books_count for shelf_id, books_count in free_shelves)
+    if free < len(books):
+        raise ValidationError("На полках назначения не хватает мест: нужно %s, свободно %s." % (len(books), free))
+
+    # книги раскладываются по свободным полкам назначения по порядку, как при возврате
+    moves = []
+    books_to_place = iter(books)
+    for shelf_id, books_count in free_shelves:
+        for book_id, number, from_shelf_id in itertools.islice(books_to_place, MAX_BOOKS_ON_SHELF - books_count):
+            moves.append({'book': number, 'from_book_shelf': from_shelf_id, 'to_book_shelf': shelf_id})
+    if dry_run or not moves:
+        return moves
+
+    book_ids = {number: book_id for book_id, number, from_shelf_id in books}
+    placed = defaultdict(list)
+    deltas = Counter()
+    for move in moves:
+        placed[move['to_book_shelf']].append(book_ids[move['book']])
+        deltas[move['from_book_shelf']] -= 1
+        deltas[move['to_book_shelf']] += 1
+
+    for shelf_id, shelf_books in placed.items():
+        Book.objects.filter(pk__in=shelf_books).update(book_shelf=shelf_id)
+    shelves_by_delta = defaultdict(list)
+    for shelf_id, delta in deltas.items():
+        shelves_by_delta[delta].append(shelf_id)
+    for delta, shelf_ids in shelves_by_delta.items():
+        BookShelf.objects.filter(pk__in=shelf_ids).update(books_count=F('books_count') + delta)
+
+    MoveBookJournal.objects.bulk_create(
+        (MoveBookJournal(book_id=book_ids[move['book']], from_book_shelf_id=move['from_book_shelf'],
+                         to_book_shelf_id=move['to_book_shelf'], librarian=librarian) for move in moves),
+        batch_size=1000)
+    return moves
+
+
+class TableVersion(models.Model):
+    # версия и время изменения таблицы, ведутся триггерами БД на каждую запись в таблицу
+    name = models.CharField('Таблица', max_length=100, primary_key=True)
+    version = models.BigIntegerField('Версия', default=0)
+    modified = models.DateTimeField('Изменена')
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
 
 
 def get_count_books_by_author(author_fio):
@@ -167,54 +560,60 @@ def get_count_books_by_author(author_fio):
 
 
 def get_top_ten_books():
-    return MoveBookJournal.objects.values('book__name').annotate(book_count=Count("book")).filter(
-        to_book_shelf__isnull=True).order_by('-book_count')[:10]
+    return BookStatistics.objects.filter(take_count__gt=0).order_by('-take_count').values(
+        'book__name', book_count=F('take_count'))[:10]
 
 
 def count_book_on_hands_by_readers():
-    return MoveBookJournal.objects.annotate(count_book=Count("reader")).values('reader__fio', 'count_book').filter(
-        returned=False)
+    return ReaderStatistics.objects.filter(books_on_hands__gt=0).values('reader__fio',
+                                                                        count_book=F('books_on_hands'))
 
 
 class GroupConcat(Aggregate):
+    # GROUP_CONCAT в SQLite, STRING_AGG в PostgreSQL; разделитель по умолчанию - запятая, как в SQLite
     function = 'GROUP_CONCAT'
-    template = '%(function)s(%(distinct)s%(expressions)s)'
+    allow_distinct = True
 
-    def __init__(self, expression, distinct=False, **extra):
+    def __init__(self, expression, distinct=False, separator=None, **extra):
+        self.separator = separator
+        expressions = [expression] if separator is None else [expression, Value(separator)]
         super(GroupConcat, self).__init__(
-            expression,
-            distinct='DISTINCT ' if distinct else '',
+            *expressions,
+            distinct=distinct,
             output_field=CharField(),
             **extra)
 
+    def as_postgresql(self, compiler, connection, **extra_context):
+        clone = self.copy()
+        expression, *rest, condition = clone.get_source_expressions()
+        clone.set_source_expressions([Cast(expression, output_field=TextField()),
+                                      Value(',' if self.separator is None else self.separator), condition])
+        return clone.as_sql(compiler, connection, function='STRING_AGG', **extra_context)
 
-def get_halls_with_related_cases_and_shelfs():
-    shelves_subquery = Subquery(BookShelf.objects.filter(book_case=OuterRef('pk')).values('book_case').annotate(
-        bookShelvesNumbers=GroupConcat('number')).values('bookShelvesNumbers'))
-
-    shelves_by_cases_subquery = Subquery(
-        BookCase.objects.annotate(shelves=shelves_subquery).values('number', 'shelves', 'book_hall').filter(
-            book_hall=OuterRef('pk')).values('shelves'))
-
-    cases_subquery = Subquery(BookCase.objects.filter(book_hall=OuterRef('pk')).values('book_hall').annotate(
-        bookCasesNumbers=GroupConcat('number')).values('bookCasesNumbers'))
 
-    halls = BookHall.objects.annotate(shelves=shelves_by_cases_subquery, cases=cases_subquery).values('name', 'cases',
-                                                                                                      'shelves')
+def get_halls_with_related_cases_and_shelfs():
+    from bookHouse.topology import get_library_topology
 
-    return list(halls)
+    return [{'name': hall['name'],
+             'cases': ','.join(str(case['number']) for case in hall['cases']) or None,
+             'shelves': ','.join(str(shelf['number']) for case in hall['cases'] for shelf in case['shelves']) or None}
+            for hall in get_library_topology()]
 
 
-# результат [{'name': 'Зал 1', 'cases': '1,2,3,4,5', 'shelves': '1,2,3,4,5,6,7,8,9,10'}, {'name': 'Зал 2', 'cases': '1,2,3,4,5', 'shelves': '1,2,3,4,5,6,7,8,9,10'}, {'name': 'Зал 3', 'cases': '1,2,3,4,5', 'shelves': '1,2,3,4,5,6,7,8,9,10'}]
+# результат [{'name': 'Зал 1', 'cases': '1,2', 'shelves': '1,2,3,1,2,3'}, {'name': 'Зал 2', 'cases': '1,2', 'shelves': '1,2,3,1,2,3'}]
+# (полки всех стеллажей зала по порядку стеллажей)
 
 def get_publications_with_books_that_not_taken():
-    cnt_mov_book_subquery = Subquery(
-        MoveBookJournal.objects.filter(book=OuterRef('pk')).annotate(book_count=Count("book")).filter(
-            to_book_shelf__isnull=True).values('book_count'))
+    # по одной книге на тип публикации, первой по id: подзапрос в SELECT должен возвращать одну строку,
+    # иначе PostgreSQL его отвергает, а SQLite молча берет первую
+    taken = Exists(MoveBookJournal.objects.filter(book=OuterRef('pk'), to_book_shelf__isnull=True))
+    if archive_needed():
+        # закрытые выдачи после архивации есть только в архиве
+        taken = taken | Exists(MoveBookJournalArchive.objects.filter(book=OuterRef('pk'),
+                                                                     to_book_shelf__isnull=True))
 
     books_not_taken_subquery = Subquery(
-        Book.objects.filter(publication_type=OuterRef('pk')).annotate(cnt_book_move=cnt_mov_book_subquery).values(
-            'name').filter(cnt_book_move__isnull=True))
+        Book.objects.filter(publication_type=OuterRef('pk')).exclude(taken).order_by('pk').values('name')[:1])
 
     return PublicationType.objects.annotate(books_not_taken_list=books_not_taken_subquery).values('name',
                                                                                                   'books_not_taken_list')
@@ -223,13 +622,47 @@ def get_publications_with_books_that_not_taken():
 # результат <QuerySet [{'name': 'Печатное', 'books_not_taken_list': 'Руслан и Людмила'}, {'name': 'Электронное', 'books_not_taken_list': 'Книга для примера'}]>
 
 
-def get_move_book_journal_shelves_by_book():
-    journal_by_shelve = MoveBookJournal.objects.values('book', 'to_book_shelf').exclude(to_book_shelf__isnull=True)
-
-    shelves_subquery = Subquery(journal_by_shelve.filter(book=OuterRef('pk')).values('book').annotate(
-        to_book_shelf_list=GroupConcat('to_book_shelf')).values('to_book_shelf_list'))
-
-    return Book.objects.annotate(shelves_list=shelves_subquery).values(
-        'name', 'shelves_list')
+def archive_needed(date_from=None):
+    # архив читается, только если период начинается не позже самой новой архивной записи
+    newest = MoveBookJournalArchive.objects.order_by('-date_time_move').values_list('date_time_move', flat=True).first()
+    return newest is not None and (date_from is None or date_from <= newest)
+
+
+def filter_journal_period(queryset, date_from=None, date_to=None):
+    if date_from is not None:
+        queryset = queryset.filter(date_time_move__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date_time_move__lt=date_to)
+    return queryset
+
+
+def get_journal_values_list(fields, date_from=None, date_to=None):
+    journals = [MoveBookJournal]
+    if archive_needed(date_from):
+        journals.append(MoveBookJournalArchive)
+    querysets = [filter_journal_period(journal.objects.all(), date_from, date_to).values_list(*fields)
+                 for journal in journals]
+    return querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+
+
+def get_move_book_journal_shelves_by_book(date_from=None, date_to=None):
+    def shelves_subquery(journal):
+        journal_by_shelve = filter_journal_period(journal.objects.values('book', 'to_book_shelf').exclude(
+            to_book_shelf__isnull=True), date_from, date_to)
+        return Subquery(journal_by_shelve.filter(book=OuterRef('pk')).values('book').annotate(
+            to_book_shelf_list=GroupConcat('to_book_shelf')).values('to_book_shelf_list'))
+
+    if not archive_needed(date_from):
+        return Book.objects.annotate(shelves_list=shelves_subquery(MoveBookJournal)).values('name', 'shelves_list')
+
+    # архивные полки идут первыми, они старше
+    books = Book.objects.annotate(hot_shelves_list=shelves_subquery(MoveBookJournal),
+                                  archive_shelves_list=shelves_subquery(MoveBookJournalArchive))
+    books = books.annotate(shelves_list=Case(
+        When(archive_shelves_list__isnull=True, then=F('hot_shelves_list')),
+        When(hot_shelves_list__isnull=True, then=F('archive_shelves_list')),
+        default=Concat(F('archive_shelves_list'), Value(','), F('hot_shelves_list')),
+        output_field=CharField()))
+    return books.values('name', 'shelves_list')
 
 # <QuerySet [{'name': 'Руслан и Людмила', 'shelves_list': '3'}, {'name': 'Сборник стихов', 'shelves_list': '1,21'}, {'name': 'Книга для примера', 'shelves_list': None}]>
@@ -0,0 +1,19 @@
+from rest_framework import pagination
+
+
+class LibraryCursorPagination(pagination.CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('pk',)
+
+    def get_ordering(self, request, queryset, view):
+        # ?ordering=name и другие неуникальные поля: без pk порядок одинаковых значений не определен,
+        # и курсор на границе страницы пропускает или повторяет строки
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering += ('-pk',) if ordering[0].startswith('-') else ('pk',)
+        return ordering
+
+
+class MoveBookJournalCursorPagination(LibraryCursorPagination):
+    ordering = ('date_time_move', 'pk')
@@ -0,0 +1,61 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from bookHouse.models import Book
+
+# веса столбцов name, description, authors для bm25: совпадение в названии важнее описания
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+
+AUTHORS_SQL = '''
+    (SELECT group_concat(a.fio, ' ') FROM "bookHouse_book_author" ba
+     INNER JOIN "bookHouse_author" a ON a.id = ba.author_id WHERE ba.book_id = b.id)
+'''
+
+
+def build_match_query(text):
+    # каждое слово ищется как префикс, спецсимволы FTS5 из запроса не пропускаем
+    return ' '.join('"%s"*' % word for word in re.findall(r'\w+', text))
+
+
+def search_book_ids(text, limit=20):
+    if connection.vendor != 'sqlite':
+        return search_book_ids_without_index(text, limit)
+    match = build_match_query(text)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM "bookHouse_book_search" WHERE "bookHouse_book_search" MATCH %s '
+            'ORDER BY bm25("bookHouse_book_search", %s, %s, %s) LIMIT %s',
+            [match, *SEARCH_WEIGHTS, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_book_ids_without_index(text, limit=20):
+    # индекс FTS5 есть только в SQLite: на других СУБД каждое слово ищется подстрокой без ранжирования
+    words = re.findall(r'\w+', text)
+    if not words:
+        return []
+    books = Book.objects.all()
+    for word in words:
+        books = books.filter(Q(name__icontains=word) | Q(description__icontains=word) | Q(author__fio__icontains=word))
+    return list(books.order_by('pk').values_list('pk', flat=True).distinct()[:limit])
+
+
+def search_books(text, limit=20):
+    ids = search_book_ids(text, limit)
+    books = Book.objects.select_related('publication_type').prefetch_related('author').in_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
+
+
+def rebuild_book_search():
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM "bookHouse_book_search"')
+        cursor.execute(
+            'INSERT INTO "bookHouse_book_search" (rowid, name, description, authors) '
+            'SELECT b.id, b.name, b.description, coalesce(%s, \'\') FROM "bookHouse_book" b' % AUTHORS_SQL)
+        cursor.execute('INSERT INTO "bookHouse_book_search" ("bookHouse_book_search") VALUES (\'optimize\')')
@@ -1,10 +1,47 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 from bookHouse.models import Book, Reader, Author, PublicationType, Librarian, BookHall, BookCase, BookShelf, \
     MoveBookJournal
 
 
-class AuthorSerializer(serializers.HyperlinkedModelSerializer):
+def get_sparse_params(request):
+    # ?fields=a,b - только перечисленные поля; ?expand=x,y - вложенными остаются только перечисленные связи,
+    # остальные отдаются первичными ключами. Без параметров ответ не меняется
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+
+    def parse(name):
+        if name not in request.query_params:
+            return None
+        return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+    return parse('fields'), parse('expand')
+
+
+def is_nested(field):
+    return isinstance(field, serializers.BaseSerializer)
+
+
+class SparseFieldsMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        root = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if root is not None:
+            return fields
+
+        requested, expand = get_sparse_params(self.context.get('request'))
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        if expand is not None:
+            for name, field in fields.items():
+                if is_nested(field) and name not in expand:
+                    fields[name] = serializers.PrimaryKeyRelatedField(
+                        many=isinstance(field, serializers.ListSerializer), read_only=True)
+        return fields
+
+
+class AuthorSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Author
         fields = [
@@ -12,7 +49,7 @@ class AuthorSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class PublicationTypeSerializer(serializers.HyperlinkedModelSerializer):
+class PublicationTypeSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = PublicationType
         fields = [
@@ -20,7 +57,7 @@ class PublicationTypeSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class BookSerializer(serializers.HyperlinkedModelSerializer):
+class BookSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     publication_type = PublicationTypeSerializer()
     author = AuthorSerializer(many=True)
 
@@ -56,7 +93,7 @@ class BookSerializer(serializers.HyperlinkedModelSerializer):
         return book
 
 
-class ReaderSerializer(serializers.HyperlinkedModelSerializer):
+class ReaderSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Reader
         fields = [
@@ -64,7 +101,7 @@ class ReaderSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class LibrarianSerializer(serializers.HyperlinkedModelSerializer):
+class LibrarianSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Librarian
         fields = [
@@ -72,7 +109,7 @@ class LibrarianSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class BookHallSerializer(serializers.HyperlinkedModelSerializer):
+class BookHallSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     librarian = LibrarianSerializer()
     get_book_cases_names = serializers.ReadOnlyField()
 
@@ -96,7 +133,7 @@ class BookHallSerializer(serializers.HyperlinkedModelSerializer):
         return hall
 
 
-class BookCaseSerializer(serializers.HyperlinkedModelSerializer):
+class BookCaseSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     book_hall = BookHallSerializer()
     get_book_shelf_names = serializers.ReadOnlyField()
 
@@ -109,7 +146,7 @@ class BookCaseSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class BookShelfSerializer(serializers.HyperlinkedModelSerializer):
+class BookShelfSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     book_case = BookCaseSerializer()
 
     class Meta:
@@ -120,7 +157,7 @@ class BookShelfSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class MoveBookJournalSerializer(serializers.HyperlinkedModelSerializer):
+class MoveBookJournalSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     book = serializers.SlugRelatedField(queryset=Book.objects.all(), slug_field='name')
     from_book_shelf = serializers.PrimaryKeyRelatedField(queryset=BookShelf.objects.all())
     to_book_shelf = serializers.PrimaryKeyRelatedField(queryset=BookShelf.objects.all())
@@ -134,3 +171,65 @@ class MoveBookJournalSerializer(serializers.HyperlinkedModelSerializer):
             'to_book_shelf',
             'librarian',
         ]
+
+
+class CirculationSerializer(serializers.Serializer):
+    numbers = serializers.ListField(child=serializers.IntegerField(min_value=0), allow_empty=False, max_length=1000)
+    reader = serializers.PrimaryKeyRelatedField(queryset=Reader.objects.all())
+    librarian = serializers.SlugRelatedField(queryset=Librarian.objects.all(), slug_field='fio')
+
+
+class RelocationSerializer(serializers.Serializer):
+    source_shelf = serializers.PrimaryKeyRelatedField(queryset=BookShelf.objects.all(), required=False)
+    source_case = serializers.PrimaryKeyRelatedField(queryset=BookCase.objects.all(), required=False)
+    source_hall = serializers.PrimaryKeyRelatedField(queryset=BookHall.objects.all(), required=False)
+    target_shelf = serializers.PrimaryKeyRelatedField(queryset=BookShelf.objects.all(), required=False)
+    target_case = serializers.PrimaryKeyRelatedField(queryset=BookCase.objects.all(), required=False)
+    target_hall = serializers.PrimaryKeyRelatedField(queryset=BookHall.objects.all(), required=False)
+    librarian = serializers.SlugRelatedField(queryset=Librarian.objects.all(), slug_field='fio')
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        for side in ('source', 'target'):
+            scopes = [data.pop(name) for name in ('%s_shelf' % side, '%s_case' % side, '%s_hall' % side)
+                      if name in data]
+            if len(scopes) != 1:
+                raise serializers.ValidationError({side: "Укажите ровно одно из: полка, стеллаж, зал."})
+            data[side] = scopes[0]
+        return data
+
+
+class HistorySerializer(serializers.Serializer):
+    at = serializers.DateTimeField()
+    shelf = serializers.PrimaryKeyRelatedField(queryset=BookShelf.objects.all(), required=False)
+    case = serializers.PrimaryKeyRelatedField(queryset=BookCase.objects.all(), required=False)
+    hall = serializers.PrimaryKeyRelatedField(queryset=BookHall.objects.all(), required=False)
+
+    def validate(self, data):
+        scopes = [data.pop(name) for name in ('shelf', 'case', 'hall') if name in data]
+        if len(scopes) > 1:
+            raise serializers.ValidationError({'scope': "Укажите не больше одного из: полка, стеллаж, зал."})
+        data['scope'] = scopes[0] if scopes else None
+        return data
+
+
+class BookSearchSerializer(serializers.Serializer):
+    q = serializers.CharField()
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class BookImportSerializer(BookSerializer):
+    # уникальность номеров при импорте проверяется одним запросом на пачку
+    class Meta(BookSerializer.Meta):
+        extra_kwargs = {'number': {'validators': []}}
+
+
+class ExportSerializer(serializers.Serializer):
+    export_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+
+
+class KeysetPageSerializer(serializers.Serializer):
+    after = serializers.IntegerField(min_value=0, required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=1000, default=100)
@@ -0,0 +1,30 @@
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from bookHouse.cache import invalidate_models
+from bookHouse.models import BookHall, BookCase, BookShelf
+from bookHouse.topology import invalidate_topology_on_change
+
+
+@receiver([post_save, post_delete], sender=BookHall)
+@receiver([post_save, post_delete], sender=BookCase)
+@receiver([post_save, post_delete], sender=BookShelf)
+def invalidate_topology_handler(sender, **kwargs):
+    invalidate_topology_on_change()
+
+
+def invalidate_response_cache_handler(sender, **kwargs):
+    invalidate_models(sender)
+
+
+def invalidate_response_cache_m2m_handler(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        invalidate_models(sender, type(instance), model)
+
+
+for model in apps.get_app_config('bookHouse').get_models():
+    post_save.connect(invalidate_response_cache_handler, sender=model)
+    post_delete.connect(invalidate_response_cache_handler, sender=model)
+
+m2m_changed.connect(invalidate_response_cache_m2m_handler)
@@ -1,3 +1,1026 @@
-from django.test import TestCase
+import json
+import threading
+from importlib import import_module
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from bookHouse.models import (Librarian, BookHall, BookCase, BookShelf, Book, Author, PublicationType, Reader,
+                              MoveBookJournal, MAX_BOOKS_ON_SHELF, ShelfIsFull, take_books_on_hands,
+                              return_books_to_library, BookOnHands, MAX_BOOKS_ON_HANDS, get_top_ten_books,
+                              get_move_book_journal_shelves_by_book, count_book_on_hands_by_readers,
+                              get_halls_with_related_cases_and_shelfs, get_publications_with_books_that_not_taken,
+                              BookStatistics, ReaderStatistics, relocate_books, MoveBookJournalArchive,
+                              LocationSnapshot, TableVersion)
+from bookHouse.archive import archive_journal
+from bookHouse.history import get_book_locations, get_shelf_occupancy, get_book_location, take_location_snapshot
+from bookHouse.benchmark import generate_library, bench_reports, compare_results, bench_mixed_load
+from bookHouse.cache import get_response_cache
+from bookHouse.conditional import table_versions_supported
+from bookHouse.fast_list import get_row_encoder
+from bookHouse.management.arguments import datetime_argument
+from bookHouse.catalogue_import import import_books, read_json_lines, read_csv
+from bookHouse.search import search_books, search_book_ids_without_index
+from bookHouse.topology import invalidate_topology
+from bookHouse.transactions import atomic_with_retry
+from bookHouse.views import BookViewSet, MoveBookJournalViewSet
+from library.metrics import REGISTRY
+
+# чтение версий таблиц для ETag, оно есть только там, где версии ведут триггеры
+VERSION_QUERIES = 1 if table_versions_supported() else 0
+
+TRIGGER_TABLES_SQL = {
+    'sqlite': "SELECT tbl_name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_version_%'",
+    'postgresql': "SELECT event_object_table FROM information_schema.triggers WHERE trigger_name LIKE '%_version'",
+}
+
+
+def create_library(halls=1, cases=1, shelves=1):
+    librarian, created = Librarian.objects.get_or_create(fio='Библиотекарь')
+    result = []
+    for hall_number in range(halls):
+        hall = BookHall.objects.create(name='Зал %s' % (hall_number + 1), librarian=librarian)
+        for case_number in range(cases):
+            case = BookCase.objects.create(number=case_number + 1, book_hall=hall)
+            for shelf_number in range(shelves):
+                result.append(BookShelf.objects.create(number=shelf_number + 1, book_case=case))
+    return result
+
+
+def create_books(count, start=1, shelf=None):
+    publication_type, created = PublicationType.objects.get_or_create(name='Печатное')
+    author, created = Author.objects.get_or_create(fio='Автор')
+    books = []
+    for number in range(start, start + count):
+        book = Book.objects.create(name='Книга %s' % number, number=number, page_count=100, description='Описание',
+                                   publication_type=publication_type, book_shelf=shelf)
+        book.author.add(author)
+        books.append(book)
+    return books
+
+
+class QueryCountTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, fill):
+        fill(1)
+        small = self.count_queries(url)
+        fill(10)
+        self.assertEqual(small, self.count_queries(url))
+
+
+class TopologyListQueriesTest(QueryCountTestCase):
+    def fill(self, halls):
+        create_library(halls=halls, cases=2, shelves=3)
+
+    def test_shelfs_list(self):
+        self.assertConstantQueries(reverse('bookshelf-list'), self.fill)
+
+    def test_cases_list(self):
+        self.assertConstantQueries(reverse('bookcase-list'), self.fill)
+
+    def test_halls_list(self):
+        self.assertConstantQueries(reverse('bookhall-list'), self.fill)
+
+    def test_shelf_names(self):
+        create_library(halls=1, cases=1, shelves=3)
+        response = self.client.get(reverse('bookcase-list'))
+        self.assertEqual(response.json()['results'][0]['get_book_shelf_names'], '1, 2, 3')
+
+
+class BookListQueriesTest(QueryCountTestCase):
+    def fill(self, count):
+        create_books(count, start=Book.objects.count() + 1)
+
+    def test_books_list(self):
+        self.assertConstantQueries(reverse('book-list'), self.fill)
+
+    def test_book_detail(self):
+        book = create_books(1)[0]
+        book.author.add(Author.objects.create(fio='Соавтор'))
+        with self.assertNumQueries(VERSION_QUERIES + 2):
+            response = self.client.get(reverse('book-detail', args=[book.pk]))
+        self.assertEqual(len(response.json()['author']), 2)
+
+    def test_cursor_ordering_by_non_unique_field(self):
+        books = create_books(7)
+        Book.objects.filter(pk__in=[book.pk for book in books[:5]]).update(name='Одинаковое название')
+        seen = []
+        url = reverse('book-list') + '?ordering=name&page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['number'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(sorted(seen), [book.number for book in books])
+
+    def test_str_without_publication_type(self):
+        book = create_books(1)[0]
+        book.publication_type = None
+        self.assertEqual(str(book), 'Книга 1')
+
+    def test_sparse_fields(self):
+        create_books(3)
+        with self.assertNumQueries(VERSION_QUERIES + 1):
+            response = self.client.get(reverse('book-list'), {'fields': 'number,name'})
+        self.assertEqual(set(response.json()['results'][0]), {'number', 'name'})
+
+    def test_flat_relations(self):
+        book = create_books(1)[0]
+        author = Author.objects.create(fio='Соавтор')
+        book.author.add(author)
+        data = self.client.get(reverse('book-detail', args=[book.pk]), {'expand': ''}).json()
+        self.assertEqual(data['publication_type'], book.publication_type_id)
+        self.assertIn(author.pk, data['author'])
+
+        shelf = create_library(halls=1, cases=1, shelves=1)[0]
+        data = self.client.get(reverse('bookshelf-detail', args=[shelf.pk]), {'expand': ''}).json()
+        self.assertEqual(data['book_case'], shelf.book_case_id)
+
+
+class SparseQueriesTest(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.shelf = create_library()[0]
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+
+    def fill(self, count):
+        # по записи журнала на книгу
+        for book in create_books(count, start=Book.objects.count() + 1, shelf=self.shelf):
+            book.take_on_hands(self.reader, self.librarian)
+            BookOnHands.objects.filter(book=book).delete()
+
+    def sparse_queries(self, url, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_journal_expand_without_n_plus_one(self):
+        self.fill(2)
+        with self.assertNumQueries(VERSION_QUERIES + 1):
+            self.client.get(reverse('movebookjournal-list'), {'expand': ''})
+        self.fill(10)
+        with self.assertNumQueries(VERSION_QUERIES + 1):
+            response = self.client.get(reverse('movebookjournal-list'), {'expand': ''})
+        self.assertEqual(len(response.json()['results']), 12)
+
+    def test_plain_field_without_joins(self):
+        self.fill(2)
+        queries = self.sparse_queries(reverse('bookshelf-list'), {'fields': 'number'})
+        self.assertEqual(len(queries), VERSION_QUERIES + 1)
+        self.assertNotIn('JOIN', queries[-1])
+
+        queries = self.sparse_queries(reverse('movebookjournal-list'), {'fields': 'to_book_shelf'})
+        self.assertEqual(len(queries), VERSION_QUERIES + 1)
+        self.assertNotIn('JOIN', queries[-1])
+
+
+class TopologyTest(TestCase):
+    def setUp(self):
+        invalidate_topology()
+        self.client = APIClient()
+        self.shelves = create_library(halls=2, cases=2, shelves=2)
+
+    def test_all_cases_shelves(self):
+        self.assertEqual(get_halls_with_related_cases_and_shelfs()[0],
+                         {'name': 'Зал 1', 'cases': '1,2', 'shelves': '1,2,1,2'})
+
+    def test_cached_structure(self):
+        get_halls_with_related_cases_and_shelfs()
+        create_books(2, shelf=self.shelves[0])
+        with self.assertNumQueries(VERSION_QUERIES + 1):
+            topology = self.client.get(reverse('topology-list')).json()
+        self.assertEqual(topology[0]['cases'][0]['shelves'][0]['books_count'], 2)
+
+        BookShelf.objects.create(number=3, book_case=self.shelves[0].book_case)
+        self.assertEqual(get_halls_with_related_cases_and_shelfs()[0]['shelves'], '1,2,3,1,2')
+
+    @skipUnless(table_versions_supported(), 'версии таблиц ведут триггеры SQLite и PostgreSQL')
+    def test_etag(self):
+        response = self.client.get(reverse('topology-list'))
+        response = self.client.get(reverse('topology-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        create_books(1, shelf=self.shelves[0])
+        response = self.client.get(reverse('topology-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class ReportsTest(TestCase):
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=2)
+        self.books = create_books(3, shelf=self.shelves[0])
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+
+    def test_publications_with_books_that_not_taken(self):
+        self.books[0].take_on_hands(self.reader, self.librarian)
+        self.assertEqual(list(get_publications_with_books_that_not_taken()),
+                         [{'name': 'Печатное', 'books_not_taken_list': 'Книга 2'}])
+
+    def test_journal_shelves_by_book(self):
+        book = self.books[0]
+        book.take_on_hands(self.reader, self.librarian)
+        book.return_to_library(self.reader, self.librarian)
+        shelves = {row['name']: row['shelves_list'] for row in get_move_book_journal_shelves_by_book()}
+        self.assertEqual(shelves[book.name], str(self.shelves[0].pk))
+        self.assertIsNone(shelves['Книга 2'])
+
+    def test_search_without_index(self):
+        self.books[1].author.add(Author.objects.create(fio='Пушкин Александр'))
+        self.assertEqual(search_book_ids_without_index('Пушк Книга'), [self.books[1].pk])
+
+
+class BookSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.pushkin = Author.objects.create(fio='Пушкин Александр')
+        self.book, self.other = create_books(2)
+        self.book.name = 'Руслан и Людмила'
+        self.book.save()
+        self.book.author.add(self.pushkin)
+        self.other.description = 'Сказка про Людмилу'
+        self.other.save()
+
+    def test_prefix_and_ranking(self):
+        self.assertEqual(search_books('людм'), [self.book, self.other])
+        self.assertEqual(search_books('пушк'), [self.book])
+
+    def test_index_follows_changes(self):
+        self.pushkin.fio = 'Лермонтов'
+        self.pushkin.save()
+        self.assertEqual(search_books('пушкин'), [])
+        self.assertEqual(search_books('лермонтов'), [self.book])
+
+        self.book.author.clear()
+        self.assertEqual(search_books('лермонтов'), [])
+
+        self.other.delete()
+        self.assertEqual(search_books('людмил'), [self.book])
+
+    def test_rebuild(self):
+        call_command('rebuild_book_search', stdout=StringIO())
+        self.assertEqual(search_books('пушк'), [self.book])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('book-search'), {'q': 'руслан "люд'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['number'] for row in response.json()], [self.book.number])
+        self.assertEqual(self.client.get(reverse('book-search')).status_code, 400)
+
+
+class CatalogueImportTest(TestCase):
+    def book_line(self, number, authors=('Пушкин',), **extra):
+        row = {'name': 'Книга %s' % number, 'author': [{'fio': fio} for fio in authors], 'pub_date': None,
+               'publication_type': {'name': 'Печатное'}, 'number': number, 'page_count': 100,
+               'description': 'Описание'}
+        row.update(extra)
+        return json.dumps(row, ensure_ascii=False)
+
+    def test_json_lines(self):
+        create_books(1)
+        lines = [self.book_line(1), self.book_line(2, authors=('Пушкин', 'Лермонтов')), '{broken',
+                 self.book_line(3, page_count=-1), self.book_line(2), self.book_line(4, authors=())]
+
+        result = import_books(read_json_lines(lines), chunk_size=2)
+
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([error['line'] for error in result['errors']], [1, 3, 4, 5])
+        self.assertEqual(sorted(Book.objects.get(number=2).author.values_list('fio', flat=True)),
+                         ['Лермонтов', 'Пушкин'])
+        self.assertEqual(Author.objects.filter(fio='Пушкин').count(), 1)
+        self.assertEqual(PublicationType.objects.count(), 1)
+
+    def test_queries_per_chunk(self):
+        lines = [self.book_line(number, authors=('Автор %s' % number,)) for number in range(1, 51)]
+        with self.assertNumQueries(9):
+            result = import_books(read_json_lines(lines), chunk_size=100)
+        self.assertEqual(result['created'], 50)
+
+    def test_csv_endpoint(self):
+        content = ('name,author,pub_date,publication_type,number,page_count,description\n'
+                   'Руслан и Людмила,Пушкин; Жуковский,,Печатное,7,120,Поэма\n')
+        upload = SimpleUploadedFile('books.csv', content.encode())
+
+        response = APIClient().post(reverse('book-import-catalogue'), {'file': upload})
+
+        self.assertEqual(response.json(), {'created': 1, 'errors': []})
+        self.assertEqual(Book.objects.get(number=7).author.count(), 2)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shelves = create_library()
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+        self.books = create_books(2, shelf=self.shelves[0])
+        self.books[0].author.add(Author.objects.create(fio='Соавтор'))
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_books_csv_round_trips_to_import(self):
+        content = self.read(self.client.get(reverse('book-export')))
+        Book.objects.all().delete()
+
+        result = import_books(read_csv(content.splitlines()))
+
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(sorted(Book.objects.get(number=1).author.values_list('fio', flat=True)), ['Автор', 'Соавтор'])
+
+    def test_journal_ndjson_date_range(self):
+        self.books[0].take_on_hands(self.reader, self.librarian)
+        moment = MoveBookJournal.objects.get().date_time_move
+        self.books[1].take_on_hands(self.reader, self.librarian)
+        MoveBookJournal.objects.exclude(book=self.books[0]).update(date_time_move=moment + timedelta(days=1))
+
+        content = self.read(self.client.get(reverse('movebookjournal-export'), {
+            'export_format': 'ndjson', 'date_to': (moment + timedelta(hours=1)).isoformat()}))
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row['book'], row['reader']) for row in rows], [('Книга 1', 'Читатель')])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_data', 'readers', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['id,fio', '%s,Читатель' % self.reader.pk])
+
+    def test_command_rejects_bad_dates(self):
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'move-book', '--date-from', '2024-13-01', stdout=StringIO())
+        self.assertEqual(datetime_argument('2024-01-31T12:00'), datetime(2024, 1, 31, 12, tzinfo=timezone.utc))
+
+
+class ResponseCacheTest(QueryCountTestCase):
+    def get_stats(self):
+        return self.client.get(reverse('cache-stats-list')).json().get('bookhall', {'hits': 0, 'misses': 0})
+
+    def test_hit_and_invalidation(self):
+        before = self.get_stats()
+        create_library(halls=2)
+        url = reverse('bookhall-list') + '?ordering=name'
+        first = self.client.get(url).json()
+        # остается только чтение версий таблиц для ETag
+        self.assertEqual(self.count_queries(url), VERSION_QUERIES)
+        self.assertEqual(self.client.get(url).json(), first)
+
+        BookCase.objects.create(number=2, book_hall=BookHall.objects.get(name='Зал 1'))
+        self.assertEqual(self.client.get(url).json()['results'][0]['get_book_cases_names'], '1, 2')
+
+        after = self.get_stats()
+        self.assertEqual({kind: after[kind] - before[kind] for kind in after}, {'hits': 2, 'misses': 2})
+
+    def test_m2m_and_bulk_import_invalidate(self):
+        url = reverse('author-list')
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+        create_books(1)
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+
+        import_books(read_json_lines(['{"name": "К", "author": [{"fio": "Новый"}], "publication_type": {"name": "П"}, '
+                                      '"number": 5, "page_count": 1, "description": "О"}']))
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+
+
+@skipUnless(table_versions_supported(), 'версии таблиц ведут триггеры SQLite и PostgreSQL')
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shelves = create_library()
+        self.books = create_books(2, shelf=self.shelves[0])
+
+    def test_not_modified_without_list_query(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_bulk_update_changes_etag(self):
+        url = reverse('bookshelf-list')
+        etag = self.client.get(url)['ETag']
+
+        self.books[0].take_on_hands(Reader.objects.create(fio='Читатель'), Librarian.objects.get())
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotEqual(self.client.get(reverse('book-list') + '?ordering=name')['ETag'],
+                            self.client.get(reverse('book-list'))['ETag'])
+
+    def test_triggers_only_on_etag_tables(self):
+        views = import_module('bookHouse.views')
+        tables = {model._meta.db_table for view in vars(views).values()
+                  for model in getattr(view, 'version_models', ())}
+        with connection.cursor() as cursor:
+            cursor.execute(TRIGGER_TABLES_SQL[connection.vendor])
+            self.assertEqual({table for table, in cursor.fetchall()}, tables)
+
+        self.books[0].take_on_hands(Reader.objects.create(fio='Читатель'), Librarian.objects.get())
+        self.assertEqual(set(TableVersion.objects.values_list('name', flat=True)), tables)
+
+
+class CursorPaginationTest(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        librarian = Librarian.objects.create(fio='Библиотекарь')
+        book = create_books(1)[0]
+        MoveBookJournal.objects.bulk_create(
+            MoveBookJournal(book=book, librarian=librarian) for _ in range(25))
+
+    def test_move_book_pages(self):
+        url = reverse('movebookjournal-list') + '?page_size=10'
+        seen = []
+        queries = set()
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            queries.add(len(context.captured_queries))
+            for query in context.captured_queries:
+                self.assertNotIn('OFFSET', query['sql'])
+            seen.extend(row['book'] for row in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(queries), 1)
+
+
+class FastListTest(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        shelf = create_library()[0]
+        books = create_books(8, shelf=shelf)
+        books[0].author.add(Author.objects.create(fio='Соавтор "в кавычках"'))
+        books[1].publication_type = None
+        books[1].pub_date = date(1833, 10, 1)
+        books[1].save()
+        librarian = Librarian.objects.get()
+        MoveBookJournal.objects.bulk_create(
+            MoveBookJournal(book=book, to_book_shelf=shelf, librarian=librarian) for book in books)
+
+    def assertSameAsSerializer(self, viewset, url):
+        self.assertIsNotNone(get_row_encoder(viewset.serializer_class))
+        while url:
+            fast = self.client.get(url)
+            with mock.patch.object(viewset, 'fast_list', False):
+                slow = self.client.get(url)
+            self.assertEqual(fast.content, slow.content)
+            url = fast.json()['next']
+
+    def test_books(self):
+        self.assertSameAsSerializer(BookViewSet, reverse('book-list') + '?page_size=5')
+        self.assertSameAsSerializer(BookViewSet, reverse('book-list') + '?page_size=5&ordering=-name')
+
+    def test_move_book(self):
+        self.assertSameAsSerializer(MoveBookJournalViewSet, reverse('movebookjournal-list') + '?page_size=5')
+
+    def test_queries(self):
+        self.assertEqual(self.count_queries(reverse('book-list')), VERSION_QUERIES + 2)
+
+
+class AsyncReadTest(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        shelf = create_library()[0]
+        self.books = create_books(5, shelf=shelf)
+        librarian = Librarian.objects.get()
+        MoveBookJournal.objects.bulk_create(
+            MoveBookJournal(book=self.books[0], to_book_shelf=shelf, librarian=librarian) for _ in range(3))
+        self.sync_books = APIClient().get(reverse('book-list')).json()['results']
+
+    async def test_books_pages(self):
+        url = reverse('async-book-list') + '?page_size=2'
+        results = []
+        while url:
+            data = (await self.client.get(url)).json()
+            results.extend(data['results'])
+            url = data['next']
+        self.assertEqual(results, self.sync_books)
+
+    async def test_detail_and_journal(self):
+        book = self.books[0]
+        response = await self.client.get(reverse('async-book-detail', args=[book.pk]))
+        self.assertEqual(response.json()['number'], book.number)
+        response = await self.client.get(reverse('async-book-detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+        data = (await self.client.get(reverse('async-book-journal', args=[book.pk]))).json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['results'][0]['book'], book.name)
+
+    async def test_invalid_page_size(self):
+        response = await self.client.get(reverse('async-reader-list'), {'page_size': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTest(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        REGISTRY.clear()
+        create_books(2)
+
+    def test_request_metrics(self):
+        queries = self.count_queries(reverse('book-list'))
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('library_request_queries_sum{view="book-list",method="GET"} %s' % float(queries), metrics)
+        self.assertIn('library_request_render_seconds_count{view="book-list",method="GET"} 1', metrics)
+        self.assertIn('library_response_size_bytes_bucket{view="book-list",method="GET",le="+Inf"} 1', metrics)
+        self.assertNotIn('view="metrics"', metrics)
+
+    async def test_asgi_request_metrics(self):
+        # под ASGI запросы к БД идут в потоке sync_to_async, а не в потоке middleware
+        client = AsyncClient()
+        for name in ('async-book-list', 'book-list'):
+            response = await client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            counts, queries = REGISTRY.histograms['library_request_queries'].series[(name, 'GET')]
+            self.assertGreater(queries, 0)
+
+    @override_settings(METRICS={'SLOW_QUERY_SECONDS': 0})
+    def test_slow_queries_log(self):
+        with self.assertLogs('library.metrics', 'WARNING') as logs:
+            self.client.get(reverse('book-detail', args=[Book.objects.first().pk]))
+        self.assertIn('book-detail', logs.output[0])
+
+
+class BenchmarkTest(TestCase):
+    def test_generated_library_is_consistent(self):
+        generate_library(halls=1, cases=1, shelves=2, books=12, authors=3, readers=2, journal=20)
+        for shelf in BookShelf.objects.all():
+            self.assertEqual(shelf.books_count, shelf.books.count())
+        self.assertEqual(MoveBookJournal.objects.count(), 20)
+        self.assertFalse(BookOnHands.objects.exists())
+        self.assertEqual(sum(BookStatistics.objects.values_list('take_count', flat=True)), 10)
+        self.assertEqual(len(bench_reports(repeat=1)), 7)
+
+    def test_compare_results(self):
+        baseline = {'small': {'report:a': {'median_ms': 10.0}, 'report:b': {'median_ms': 10.0}}}
+        current = {'small': {'report:a': {'median_ms': 11.0}, 'report:b': {'median_ms': 30.0}}}
+        self.assertEqual([row[-1] for row in compare_results(baseline, current, 1.2)], [False, True])
+
+
+class MixedLoadBenchmarkTest(TransactionTestCase):
+    def test_threads_write_through_models(self):
+        generate_library(halls=1, cases=1, shelves=2, books=12, authors=3, readers=2, journal=20)
+        counts = bench_mixed_load(threads=2, seconds=0.3, write_ratio=0.5)
+
+        self.assertGreater(counts['reads'], 0)
+        self.assertGreater(counts['writes'], 0)
+        self.assertEqual(counts['errors'], 0)
+        self.assertEqual(MoveBookJournal.objects.count(), 20 + counts['writes'])
+        for shelf in BookShelf.objects.all():
+            self.assertEqual(shelf.books_count, shelf.books.count())
+
+
+class RelocationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shelves = create_library(halls=2, cases=1, shelves=2)
+        self.source, self.target = BookHall.objects.order_by('pk')
+        create_books(MAX_BOOKS_ON_SHELF, shelf=self.shelves[0])
+        create_books(5, start=MAX_BOOKS_ON_SHELF + 1, shelf=self.shelves[1])
+        create_books(3, start=100, shelf=self.shelves[2])
+        self.librarian = Librarian.objects.get()
+
+    def test_dry_run(self):
+        moves = relocate_books(self.source, self.target, self.librarian, dry_run=True)
+        self.assertEqual(len(moves), MAX_BOOKS_ON_SHELF + 5)
+        self.assertEqual(BookShelf.objects.get(pk=self.shelves[0].pk).books_count, MAX_BOOKS_ON_SHELF)
+        self.assertFalse(MoveBookJournal.objects.exists())
+
+    def test_packing(self):
+        moves = relocate_books(self.source, self.target, self.librarian)
+        self.assertEqual([move['to_book_shelf'] for move in moves].count(self.shelves[2].pk), MAX_BOOKS_ON_SHELF - 3)
+        for shelf in BookShelf.objects.all():
+            self.assertEqual(shelf.books_count, shelf.books.count())
+            self.assertLessEqual(shelf.books_count, MAX_BOOKS_ON_SHELF)
+        self.assertEqual(Book.objects.filter(book_shelf__book_case__book_hall=self.source).count(), 0)
+        self.assertEqual(MoveBookJournal.objects.filter(from_book_shelf__isnull=False,
+                                                        to_book_shelf__isnull=False).count(), len(moves))
+
+    def test_not_enough_space(self):
+        with self.assertRaises(ValidationError):
+            relocate_books(self.source, self.shelves[2], self.librarian)
+        self.assertEqual(BookShelf.objects.get(pk=self.shelves[2].pk).books_count, 3)
+
+    def test_endpoint(self):
+        response = self.client.post(reverse('relocation-list'), {
+            'source_shelf': self.shelves[1].pk, 'target_case': self.shelves[2].book_case_id,
+            'librarian': self.librarian.fio}, format='json')
+        self.assertEqual(response.json()['moved'], 5)
+
+        response = self.client.post(reverse('relocation-list'), {
+            'source_shelf': self.shelves[0].pk, 'source_hall': self.source.pk, 'target_hall': self.target.pk,
+            'librarian': self.librarian.fio}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ShelfAllocatorTest(TestCase):
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=2)
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+
+    def test_counter_follows_book_shelf(self):
+        book = create_books(1, shelf=self.shelves[0])[0]
+        self.shelves[0].refresh_from_db()
+        self.assertEqual(self.shelves[0].books_count, 1)
+
+        book.book_shelf = self.shelves[1]
+        book.save()
+        self.assertEqual(list(BookShelf.objects.order_by('id').values_list('books_count', flat=True)), [0, 1])
+
+        book.delete()
+        self.assertEqual(list(BookShelf.objects.order_by('id').values_list('books_count', flat=True)), [0, 0])
+
+    def test_full_shelf_is_rejected(self):
+        create_books(MAX_BOOKS_ON_SHELF, shelf=self.shelves[0])
+        with self.assertRaises(ShelfIsFull):
+            create_books(1, start=MAX_BOOKS_ON_SHELF + 1, shelf=self.shelves[0])
+
+    def test_return_takes_first_free_shelf(self):
+        create_books(MAX_BOOKS_ON_SHELF, shelf=self.shelves[0])
+        book = create_books(1, start=MAX_BOOKS_ON_SHELF + 1)[0]
+        with self.assertNumQueries(1):
+            self.assertEqual(book.give_first_shelf_book(), self.shelves[1])
+
+        book.return_to_library(self.reader, self.librarian)
+        self.assertEqual(book.book_shelf, self.shelves[1])
+
+    def test_no_free_shelves(self):
+        create_books(MAX_BOOKS_ON_SHELF, shelf=self.shelves[0])
+        create_books(MAX_BOOKS_ON_SHELF, start=MAX_BOOKS_ON_SHELF + 1, shelf=self.shelves[1])
+        book = create_books(1, start=2 * MAX_BOOKS_ON_SHELF + 1)[0]
+        with self.assertRaises(ValidationError):
+            book.return_to_library(self.reader, self.librarian)
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shelves = create_library(halls=1, cases=1, shelves=2)
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+        self.books = create_books(3, shelf=self.shelves[0])
+        first, second, third = self.books
+        for _ in range(2):
+            first.take_on_hands(self.reader, self.librarian)
+            first.return_to_library(self.reader, self.librarian)
+        second.take_on_hands(self.reader, self.librarian)
+        third.take_on_hands(self.reader, self.librarian)
+        third.return_to_library(self.reader, self.librarian)
+        self.old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        MoveBookJournal.objects.update(date_time_move=self.old)
+        self.before = self.old + timedelta(days=1)
+
+    def test_keeps_open_loans_and_last_moves(self):
+        self.assertEqual(archive_journal(self.before, batch_size=2), 4)
+
+        # у первой книги остался последний возврат, у второй - незакрытая выдача, у третьей - возврат
+        self.assertEqual(sorted(MoveBookJournal.objects.values_list('book', 'to_book_shelf')),
+                         [(self.books[0].pk, self.shelves[0].pk), (self.books[1].pk, None),
+                          (self.books[2].pk, self.shelves[0].pk)])
+        self.assertEqual(MoveBookJournalArchive.objects.count(), 4)
+        self.assertEqual(archive_journal(self.before), 0)
+
+    def test_reports_include_archive(self):
+        shelves = {row['name']: row['shelves_list'] for row in get_move_book_journal_shelves_by_book()}
+        top = list(get_top_ten_books())
+        not_taken = list(get_publications_with_books_that_not_taken())
+        archive_journal(self.before)
+
+        self.assertEqual(list(get_publications_with_books_that_not_taken()), not_taken)
+
+        self.assertEqual({row['name']: row['shelves_list'] for row in get_move_book_journal_shelves_by_book()},
+                         shelves)
+        call_command('rebuild_circulation_statistics', stdout=StringIO())
+        self.assertEqual(list(get_top_ten_books()), top)
+
+    def test_export_reads_archive_only_for_its_period(self):
+        archive_journal(self.before)
+        self.books[0].take_on_hands(self.reader, self.librarian)
+
+        response = self.client.get(reverse('movebookjournal-export'), {'export_format': 'ndjson'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 8)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('movebookjournal-export'), {
+                'export_format': 'ndjson', 'date_from': self.before.isoformat()})
+            rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 1)
+        self.assertFalse([query for query in context.captured_queries if 'UNION' in query['sql']])
+
+
+class HistoryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shelves = create_library(halls=1, cases=1, shelves=2)
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+        self.books = create_books(2, shelf=self.shelves[0]) + create_books(1, start=3, shelf=self.shelves[1])
+        first, second, third = self.books
+        steps = [
+            lambda: first.take_on_hands(self.reader, self.librarian),
+            lambda: second.take_on_hands(self.reader, self.librarian),
+            lambda: first.return_to_library(self.reader, self.librarian),
+            lambda: relocate_books(self.shelves[1], self.shelves[0], self.librarian),
+            lambda: second.return_to_library(self.reader, self.librarian),
+            lambda: third.take_on_hands(self.reader, self.librarian),
+        ]
+        # состояние после каждого шага; записи шага i получают время base + i часов
+        self.base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.states = [self.locations()]
+        for hour, step in enumerate(steps, start=1):
+            last_id = MoveBookJournal.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            step()
+            MoveBookJournal.objects.filter(id__gt=last_id).update(date_time_move=self.at(hour))
+            self.states.append(self.locations())
+            if hour == 3:
+                LocationSnapshot.objects.filter(pk=take_location_snapshot().pk).update(taken_at=self.at(hour, 10))
+
+    def at(self, hour, minute=0):
+        return self.base + timedelta(hours=hour, minutes=minute)
+
+    def locations(self):
+        return dict(Book.objects.values_list('id', 'book_shelf'))
+
+    def assert_history(self):
+        for hour, state in enumerate(self.states):
+            moment = self.at(hour, 30)
+            self.assertEqual(get_book_locations(moment), state)
+            self.assertEqual(get_shelf_occupancy(moment),
+                             [{'book_shelf': shelf.pk, 'books_count': list(state.values()).count(shelf.pk)}
+                              for shelf in self.shelves])
+            for book in self.books:
+                self.assertEqual(get_book_location(book, moment)['book_shelf'], state[book.pk])
+
+    def test_replay_from_snapshot(self):
+        self.assert_history()
+
+    def test_replay_from_current_state_without_snapshots(self):
+        LocationSnapshot.objects.all().delete()
+        self.assert_history()
+        self.assertFalse(LocationSnapshot.objects.exists())
+
+    def test_legacy_checkout_without_from_shelf(self):
+        # выдачи до атомарного оборота писались без полки, ее восстанавливает миграция 0015
+        checkout = MoveBookJournal.objects.filter(book=self.books[2], to_book_shelf__isnull=True).get()
+        shelf_id = checkout.from_book_shelf_id
+        MoveBookJournal.objects.filter(pk=checkout.pk).update(from_book_shelf=None)
+
+        import_module('bookHouse.migrations.0015_fill_journal_from_book_shelf').fill_from_book_shelf(apps, None)
+
+        self.assertEqual(MoveBookJournal.objects.get(pk=checkout.pk).from_book_shelf_id, shelf_id)
+        LocationSnapshot.objects.all().delete()
+        self.assert_history()
+
+    def test_replay_reads_archive(self):
+        archive_journal(self.at(100))
+        self.assertTrue(MoveBookJournalArchive.objects.exists())
+        self.assert_history()
+
+    def test_replay_is_bounded_by_snapshots(self):
+        LocationSnapshot.objects.filter(pk=take_location_snapshot().pk).update(taken_at=self.at(5, 10))
+        with CaptureQueriesContext(connection) as context:
+            get_book_locations(self.at(5, 30))
+        moves = [query for query in context.captured_queries if 'UNION' in query['sql']]
+        self.assertEqual(len(moves), 1)
+        self.assertIn('date_time_move', moves[0]['sql'])
+
+    def test_endpoints(self):
+        response = self.client.get(reverse('history-list'), {'at': self.at(2, 30).isoformat(),
+                                                             'shelf': self.shelves[0].pk})
+        self.assertEqual(response.json()['shelves'], [{'book_shelf': self.shelves[0].pk, 'books_count': 0}])
+
+        response = self.client.get(reverse('history-detail', args=[self.books[1].pk]),
+                                   {'at': self.at(4, 30).isoformat()})
+        self.assertEqual(response.json()['reader'], self.reader.pk)
+        self.assertIsNone(response.json()['book_shelf'])
+
+        response = self.client.get(reverse('history-list'), {'at': self.at(2).isoformat(),
+                                                             'shelf': self.shelves[0].pk,
+                                                             'hall': BookHall.objects.get().pk})
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchCirculationTest(TestCase):
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=3)
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+        self.client = APIClient()
+
+    def test_batch_return_packs_shelves(self):
+        create_books(MAX_BOOKS_ON_SHELF - 2, shelf=self.shelves[0])
+        numbers = [book.number for book in create_books(5, start=100)]
+
+        results = return_books_to_library(numbers + [100, 999], self.reader, self.librarian)
+
+        self.assertEqual([result['success'] for result in results], [True] * 5 + [False])
+        self.assertEqual(list(BookShelf.objects.order_by('id').values_list('books_count', flat=True)),
+                         [MAX_BOOKS_ON_SHELF, 3, 0])
+        self.assertEqual(MoveBookJournal.objects.filter(returned=True, to_book_shelf__isnull=False).count(), 5)
+
+    def test_batch_take_reports_per_item(self):
+        numbers = [book.number for book in create_books(3, shelf=self.shelves[0])]
+        take_books_on_hands(numbers[:1], self.reader, self.librarian)
+
+        with self.assertNumQueries(12):
+            results = take_books_on_hands(numbers, self.reader, self.librarian)
+
+        self.assertEqual([result['success'] for result in results], [False, True, True])
+        self.assertEqual(Book.objects.filter(book_shelf__isnull=True).count(), 3)
+        self.assertEqual(BookShelf.objects.get(pk=self.shelves[0].pk).books_count, 0)
+        self.assertEqual(set(MoveBookJournal.objects.values_list('from_book_shelf', flat=True)), {self.shelves[0].pk})
+
+    def test_endpoints(self):
+        numbers = [book.number for book in create_books(2, shelf=self.shelves[1])]
+        data = {'numbers': numbers, 'reader': self.reader.pk, 'librarian': self.librarian.fio}
+
+        response = self.client.post(reverse('circulation-take'), data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(result['success'] for result in response.json()['results']))
+
+        response = self.client.post(reverse('circulation-return-books'), data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(result['success'] for result in response.json()['results']))
+        self.assertEqual(Book.objects.filter(book_shelf=self.shelves[0]).count(), 2)
+
+
+class BooksOnHandsTest(TestCase):
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=1)
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+        self.books = create_books(MAX_BOOKS_ON_HANDS + 1, shelf=self.shelves[0])
+
+    def test_limit_counts_all_reader_books(self):
+        for book in self.books[:MAX_BOOKS_ON_HANDS]:
+            book.take_on_hands(self.reader, self.librarian)
+        with self.assertRaises(ValidationError):
+            self.books[-1].take_on_hands(self.reader, self.librarian)
+
+        self.books[0].return_to_library(self.reader, self.librarian)
+        self.books[-1].take_on_hands(self.reader, self.librarian)
+        self.assertEqual(set(self.reader.books_on_hands.values_list('book', flat=True)),
+                         {book.pk for book in self.books[1:]})
+
+    def test_reconcile(self):
+        other = Reader.objects.create(fio='Другой читатель')
+        for book in self.books[:2]:
+            book.take_on_hands(self.reader, self.librarian)
+        BookOnHands.objects.filter(book=self.books[0]).delete()
+        BookOnHands.objects.create(book=self.books[2], reader=other)
+
+        call_command('reconcile_books_on_hands', stdout=StringIO())
+
+        self.assertEqual(set(BookOnHands.objects.values_list('book', flat=True)), {self.books[0].pk, self.books[1].pk})
+        self.assertEqual(dict(ReaderStatistics.objects.values_list('reader', 'books_on_hands')),
+                         {self.reader.pk: 2, other.pk: 0})
+
+
+class CirculationStatisticsTest(TestCase):
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=2)
+        self.readers = [Reader.objects.create(fio='Читатель %s' % i) for i in range(2)]
+        self.librarian = Librarian.objects.get()
+        self.books = create_books(3, shelf=self.shelves[0])
+
+    def circulate(self):
+        first, second, third = self.books
+        for _ in range(2):
+            first.take_on_hands(self.readers[0], self.librarian)
+            first.return_to_library(self.readers[0], self.librarian)
+        second.take_on_hands(self.readers[0], self.librarian)
+        take_books_on_hands([first.number, third.number], self.readers[1], self.librarian)
+        return_books_to_library([third.number], self.readers[1], self.librarian)
+
+    def snapshot(self):
+        return list(get_top_ten_books()), sorted(count_book_on_hands_by_readers(), key=lambda row: row['reader__fio'])
+
+    def test_statistics_follow_circulation(self):
+        self.circulate()
+        top, on_hands = self.snapshot()
+
+        self.assertEqual(top[0], {'book__name': 'Книга 1', 'book_count': 3})
+        self.assertEqual(sorted(row['book_count'] for row in top), [1, 1, 3])
+        self.assertEqual(on_hands, [{'reader__fio': 'Читатель 0', 'count_book': 1},
+                                    {'reader__fio': 'Читатель 1', 'count_book': 1}])
+
+    def test_rebuild_matches_incremental(self):
+        self.circulate()
+        expected = self.snapshot()
+        call_command('rebuild_circulation_statistics', stdout=StringIO())
+        self.assertEqual(self.snapshot(), expected)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class JournalQueryPlanTest(TestCase):
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=2)
+        self.reader = Reader.objects.create(fio='Читатель')
+        self.librarian = Librarian.objects.get()
+        self.book = create_books(1, shelf=self.shelves[0])[0]
+
+    def assertNoFullScan(self, func, allowed=()):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if not query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                for row in cursor.execute('EXPLAIN QUERY PLAN ' + query['sql']).fetchall():
+                    detail = row[-1]
+                    if detail.startswith('SCAN ') and 'USING' not in detail:
+                        self.assertIn(detail.split()[1], allowed, '%s\n%s' % (detail, query['sql']))
+
+    def test_take_on_hands(self):
+        self.assertNoFullScan(lambda: self.book.take_on_hands(self.reader, self.librarian))
+
+    def test_return_to_library(self):
+        self.book.take_on_hands(self.reader, self.librarian)
+        self.assertNoFullScan(lambda: self.book.return_to_library(self.reader, self.librarian))
+
+    def test_get_top_ten_books(self):
+        self.assertNoFullScan(lambda: list(get_top_ten_books()))
+
+    def test_get_move_book_journal_shelves_by_book(self):
+        # перечисляются все книги, журнал читается только по индексу
+        self.assertNoFullScan(lambda: list(get_move_book_journal_shelves_by_book()), allowed=['bookHouse_book'])
+
+
+class ConcurrentCirculationTest(TransactionTestCase):
+    threads = 8
+    rounds = 5
+
+    def setUp(self):
+        self.shelves = create_library(halls=1, cases=1, shelves=3)
+        self.books = create_books(4, shelf=self.shelves[0])
+        self.librarian = Librarian.objects.get()
+        self.readers = [Reader.objects.create(fio='Читатель %s' % i) for i in range(self.threads)]
+
+    def run_desk(self, reader, results):
+        try:
+            for _ in range(self.rounds):
+                for book in atomic_with_retry(lambda: list(Book.objects.order_by('id')))():
+                    try:
+                        if book.book_shelf_id is None:
+                            book.return_to_library(reader, self.librarian)
+                        else:
+                            book.take_on_hands(reader, self.librarian)
+                    except ValidationError:
+                        results.append('rejected')
+                    else:
+                        results.append('done')
+        except Exception as error:
+            results.append(error)
+        finally:
+            connections.close_all()
+
+    def test_invariants(self):
+        results = []
+        workers = [threading.Thread(target=self.run_desk, args=(reader, results)) for reader in self.readers]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([result for result in results if not isinstance(result, str)], [])
+        self.assertEqual(MoveBookJournal.objects.count(), results.count('done'))
+
+        for shelf in BookShelf.objects.all():
+            self.assertEqual(shelf.books_count, shelf.books.count())
+            self.assertLessEqual(shelf.books_count, MAX_BOOKS_ON_SHELF)
+
+        for book in Book.objects.all():
+            issued = MoveBookJournal.objects.filter(book=book, to_book_shelf__isnull=True).count()
+            returned = MoveBookJournal.objects.filter(book=book, to_book_shelf__isnull=False).count()
+            # выдачи и возвраты одной книги строго чередуются
+            self.assertEqual(issued - returned, 0 if book.book_shelf_id else 1)
+            self.assertEqual(BookOnHands.objects.filter(book=book).exists(), book.book_shelf_id is None)
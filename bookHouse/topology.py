@@ -0,0 +1,68 @@
+import threading
+
+from django.db import transaction
+
+from bookHouse.models import BookHall, BookCase, BookShelf, MAX_BOOKS_ON_SHELF
+
+_lock = threading.Lock()
+_topology = None
+_generation = 0
+
+
+def invalidate_topology(**kwargs):
+    global _topology, _generation
+    with _lock:
+        _topology = None
+        _generation += 1
+
+
+def invalidate_topology_on_change(**kwargs):
+    invalidate_topology()
+    # повторно после коммита: дерево могли перестроить по еще не зафиксированным данным
+    transaction.on_commit(invalidate_topology)
+
+
+def _load_topology():
+    halls = {hall['id']: dict(hall, cases=[]) for hall in BookHall.objects.order_by('id').values('id', 'name')}
+    cases = {}
+    rows = BookCase.objects.order_by('book_hall', 'number', 'book_shelf__number').values(
+        'id', 'number', 'book_hall', 'book_shelf__id', 'book_shelf__number')
+    for row in rows:
+        hall = halls.get(row['book_hall'])
+        if hall is None:
+            continue
+        case = cases.get(row['id'])
+        if case is None:
+            case = cases[row['id']] = {'id': row['id'], 'number': row['number'], 'shelves': []}
+            hall['cases'].append(case)
+        if row['book_shelf__id'] is not None:
+            case['shelves'].append({'id': row['book_shelf__id'], 'number': row['book_shelf__number']})
+    return list(halls.values())
+
+
+def _get_cached_topology():
+    global _topology
+    topology = _topology
+    if topology is not None:
+        return topology
+
+    with _lock:
+        generation = _generation
+    topology = _load_topology()
+    with _lock:
+        if generation == _generation:
+            _topology = topology
+    return topology
+
+
+def get_library_topology():
+    # структура залов почти не меняется и берется из кэша, заполненность полок читается одним запросом
+    occupancy = dict(BookShelf.objects.values_list('id', 'books_count'))
+    return [
+        {'id': hall['id'], 'name': hall['name'], 'cases': [
+            {'id': case['id'], 'number': case['number'], 'shelves': [
+                {'id': shelf['id'], 'number': shelf['number'], 'books_count': occupancy.get(shelf['id'], 0),
+                 'free': max(MAX_BOOKS_ON_SHELF - occupancy.get(shelf['id'], 0), 0)}
+                for shelf in case['shelves']]}
+            for case in hall['cases']]}
+        for hall in _get_cached_topology()]
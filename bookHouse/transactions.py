@@ -0,0 +1,33 @@
+import functools
+import random
+import re
+import time
+
+from django.db import OperationalError, transaction, connection
+
+LOCK_RETRIES = 10
+LOCK_RETRY_DELAY = 0.01
+LOCK_RETRY_MAX_DELAY = 0.5
+RETRY_ERRORS = re.compile('locked|deadlock detected')
+
+
+def atomic_with_retry(func):
+    # SQLite отвечает "database is locked" при конкурентной записи, PostgreSQL прерывает одну из транзакций
+    # при взаимоблокировке: повторяем транзакцию целиком, чтобы проверки внутри нее заново увидели актуальное состояние
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            outer_atomic = connection.in_atomic_block
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as error:
+                attempt += 1
+                if not RETRY_ERRORS.search(str(error)) or outer_atomic or attempt >= LOCK_RETRIES:
+                    raise
+                # экспоненциальная пауза со случайной долей: потоки, столкнувшиеся на одной блокировке,
+                # повторяют в разное время, а не снова все вместе
+                time.sleep(random.uniform(0, min(LOCK_RETRY_MAX_DELAY, LOCK_RETRY_DELAY * 2 ** attempt)))
+
+    return wrapper
@@ -1,14 +1,137 @@
+import io
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 
 from bookHouse.models import (Book, Reader, Author, PublicationType, Librarian,
-                              BookHall, BookCase, BookShelf, MoveBookJournal)
+                              BookHall, BookCase, BookShelf, MoveBookJournal, take_books_on_hands,
+                              return_books_to_library, relocate_books)
 from bookHouse.serializers import (BookSerializer, ReaderSerializer, AuthorSerializer, PublicationTypeSerializer,
                                    LibrarianSerializer, BookHallSerializer, BookCaseSerializer, BookShelfSerializer,
-                                   MoveBookJournalSerializer)
+                                   MoveBookJournalSerializer, CirculationSerializer, RelocationSerializer,
+                                   BookSearchSerializer, ExportSerializer, HistorySerializer, get_sparse_params,
+                                   is_nested)
+from bookHouse.cache import CachedResponseMixin, get_cache_stats
+from bookHouse.conditional import ConditionalGetMixin
+from bookHouse.catalogue_import import import_books, READERS as CATALOGUE_READERS
+from bookHouse.history import get_shelf_occupancy, get_book_location
+from bookHouse.fast_list import get_row_encoder, FastJSONRenderer
+from bookHouse.export import stream_export, export_content_type
+from bookHouse.pagination import MoveBookJournalCursorPagination
+from bookHouse.search import search_books
+from bookHouse.topology import get_library_topology
+
+
+class ExportMixin:
+    export_name = None
+
+    @action(detail=False)
+    def export(self, request):
+        params = ExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        export_format = params.validated_data['export_format']
+        response = StreamingHttpResponse(
+            stream_export(self.export_name, export_format, params.validated_data.get('date_from'),
+                          params.validated_data.get('date_to')),
+            content_type=export_content_type(export_format))
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (self.export_name, export_format)
+        return response
+
+
+class SparseQuerysetMixin:
+    # связи поля ответа: (select_related, prefetch_related), нужные, когда поле отдается целиком
+    sparse_relations = {}
+
+    def get_ordering_field_names(self):
+        names = list(getattr(self.pagination_class, 'ordering', None) or ())
+        ordering = self.request.query_params.get('ordering', '')
+        names += [name.strip().lstrip('-') for name in ordering.split(',')
+                  if name.strip().lstrip('-') in (getattr(self, 'ordering_fields', None) or ())]
+        return names
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        requested, expand = get_sparse_params(self.request)
+        if requested is None and expand is None:
+            return queryset
+
+        # запрос собирается заново только из тех колонок и связей, которые попадут в ответ
+        queryset = queryset.select_related(None).prefetch_related(None)
+        model = queryset.model
+        columns = set()
+        # select_related() без аргументов тянет все связи, поэтому связи собираются и добавляются одним вызовом
+        select_names = []
+        prefetch_names = []
+        for name, field in self.get_serializer_class()().fields.items():
+            if requested is not None and name not in requested:
+                continue
+            expanded = not is_nested(field) or expand is None or name in expand
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                model_field = None
+
+            if model_field is not None and model_field.concrete and not model_field.many_to_many:
+                columns.add(name)
+            if expanded:
+                select, prefetch = self.sparse_relations.get(name, ((), ()))
+                select_names.extend(select)
+                prefetch_names.extend(prefetch)
+            elif model_field is not None and model_field.many_to_many:
+                prefetch_names.append(Prefetch(name, queryset=model_field.related_model.objects.only('pk')))
+
+        if select_names:
+            queryset = queryset.select_related(*select_names)
+        if prefetch_names:
+            queryset = queryset.prefetch_related(*prefetch_names)
 
+        for name in self.get_ordering_field_names():
+            try:
+                if model._meta.get_field(name).concrete:
+                    columns.add(name)
+            except FieldDoesNotExist:
+                pass
+        return queryset.only(*columns)
 
-class AuthorViewSet(viewsets.ModelViewSet):
+
+class FastListMixin(SparseQuerysetMixin):
+    # список только для чтения собирается из values() без экземпляров моделей и полей сериализатора
+    fast_list = True
+
+    def get_row_encoder(self, request):
+        if not self.fast_list or type(request.accepted_renderer) is not JSONRenderer:
+            return None
+        if get_sparse_params(request) != (None, None):
+            return None
+        return get_row_encoder(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        encoder = self.get_row_encoder(request)
+        if encoder is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None)
+        columns = [name for name in self.get_ordering_field_names() if name not in encoder.columns]
+        rows = queryset.values(*encoder.columns, *columns)
+        request.accepted_renderer = FastJSONRenderer()
+
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(encoder.encode(rows))
+        return self.get_paginated_response(encoder.encode(page))
+
+
+class AuthorViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    version_models = (Author,)
+    cache_models = (Author,)
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
@@ -16,7 +139,9 @@ class AuthorViewSet(viewsets.ModelViewSet):
     ordering_fields = ['fio']
 
 
-class PublicationTypeViewSet(viewsets.ModelViewSet):
+class PublicationTypeViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    version_models = (PublicationType,)
+    cache_models = (PublicationType,)
     queryset = PublicationType.objects.all()
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     serializer_class = PublicationTypeSerializer
@@ -24,23 +149,52 @@ class PublicationTypeViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name']
 
 
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+class BookViewSet(ConditionalGetMixin, ExportMixin, FastListMixin, viewsets.ModelViewSet):
+    version_models = (Book, Author, PublicationType, Book.author.through)
+    queryset = Book.objects.select_related('publication_type').prefetch_related('author')
+    sparse_relations = {
+        'author': ((), ('author',)),
+        'publication_type': (('publication_type',), ()),
+    }
     serializer_class = BookSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['name', 'pub_date', 'description']
     ordering_fields = ['name', 'pub_date', 'description']
+    export_name = 'books'
+
+    @action(detail=False)
+    def search(self, request):
+        params = BookSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        books = search_books(params.validated_data['q'], params.validated_data['limit'])
+        return Response(self.get_serializer(books, many=True).data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalogue(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ["Файл не передан."]}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if file_format not in CATALOGUE_READERS:
+            return Response({'format': ["Неизвестный формат файла."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines = io.TextIOWrapper(upload, encoding='utf-8', newline='')
+        return Response(import_books(CATALOGUE_READERS[file_format](lines)))
 
 
-class ReaderViewSet(viewsets.ModelViewSet):
+class ReaderViewSet(ConditionalGetMixin, ExportMixin, viewsets.ModelViewSet):
+    version_models = (Reader,)
     queryset = Reader.objects.all()
     serializer_class = ReaderSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['fio']
     ordering_fields = ['fio']
+    export_name = 'readers'
 
 
-class LibrarianViewSet(viewsets.ModelViewSet):
+class LibrarianViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    version_models = (Librarian,)
+    cache_models = (Librarian,)
     queryset = Librarian.objects.all()
     serializer_class = LibrarianSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
@@ -48,30 +202,118 @@ class LibrarianViewSet(viewsets.ModelViewSet):
     ordering_fields = ['fio']
 
 
-class BookHallViewSet(viewsets.ModelViewSet):
-    queryset = BookHall.objects.all()
+class BookHallViewSet(ConditionalGetMixin, CachedResponseMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    version_models = (BookHall, Librarian, BookCase)
+    cache_models = (BookHall, Librarian, BookCase)
+    queryset = BookHall.objects.select_related('librarian').prefetch_related('book_case')
+    sparse_relations = {
+        'librarian': (('librarian',), ()),
+        'get_book_cases_names': ((), ('book_case',)),
+    }
     serializer_class = BookHallSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['name']
     ordering_fields = ['name']
 
 
-class BookCaseViewSet(viewsets.ModelViewSet):
-    queryset = BookCase.objects.all()
+class BookCaseViewSet(ConditionalGetMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    version_models = (BookCase, BookHall, Librarian, BookShelf)
+    queryset = BookCase.objects.select_related('book_hall__librarian').prefetch_related(
+        'book_shelf', 'book_hall__book_case')
+    sparse_relations = {
+        'book_hall': (('book_hall__librarian',), ('book_hall__book_case',)),
+        'get_book_shelf_names': ((), ('book_shelf',)),
+    }
     serializer_class = BookCaseSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['name']
-    ordering_fields = ['name']
+    filterset_fields = ['number']
+    ordering_fields = ['number']
 
 
-class BookShelfViewSet(viewsets.ModelViewSet):
-    queryset = BookShelf.objects.all()
+class BookShelfViewSet(ConditionalGetMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    version_models = (BookShelf, BookCase, BookHall, Librarian)
+    queryset = BookShelf.objects.select_related('book_case__book_hall__librarian').prefetch_related(
+        'book_case__book_shelf', 'book_case__book_hall__book_case')
+    sparse_relations = {
+        'book_case': (('book_case__book_hall__librarian',),
+                      ('book_case__book_shelf', 'book_case__book_hall__book_case')),
+    }
     serializer_class = BookShelfSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['number']
     ordering_fields = ['number']
 
 
-class MoveBookJournalViewSet(viewsets.ModelViewSet):
-    queryset = MoveBookJournal.objects.all()
+class MoveBookJournalViewSet(ConditionalGetMixin, ExportMixin, FastListMixin, viewsets.ModelViewSet):
+    version_models = (MoveBookJournal, Book, Librarian)
+    queryset = MoveBookJournal.objects.select_related('book', 'librarian')
+    sparse_relations = {
+        'book': (('book',), ()),
+        'librarian': (('librarian',), ()),
+    }
     serializer_class = MoveBookJournalSerializer
+    pagination_class = MoveBookJournalCursorPagination
+    export_name = 'move-book'
+
+
+class CirculationViewSet(viewsets.GenericViewSet):
+    serializer_class = CirculationSerializer
+
+    @action(detail=False, methods=['post'])
+    def take(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response({'results': take_books_on_hands(data['numbers'], data['reader'], data['librarian'])})
+
+    @action(detail=False, methods=['post'], url_path='return')
+    def return_books(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response({'results': return_books_to_library(data['numbers'], data['reader'], data['librarian'])})
+
+
+class RelocationViewSet(viewsets.GenericViewSet):
+    serializer_class = RelocationSerializer
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            moves = relocate_books(data['source'], data['target'], data['librarian'], data['dry_run'])
+        except ValidationError as error:
+            return Response({'detail': error.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'moved': len(moves), 'dry_run': data['dry_run'], 'moves': moves})
+
+
+class HistoryViewSet(viewsets.ViewSet):
+    # состояние на момент ?at=: заполненность полок (можно ограничить shelf, case или hall) и место книги
+    def get_params(self, request):
+        params = HistorySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data
+
+    def list(self, request):
+        params = self.get_params(request)
+        shelves = get_shelf_occupancy(params['at'], params['scope'])
+        return Response({'at': params['at'], 'books_count': sum(shelf['books_count'] for shelf in shelves),
+                         'shelves': shelves})
+
+    def retrieve(self, request, pk=None):
+        params = self.get_params(request)
+        book = get_object_or_404(Book, pk=pk)
+        return Response({'at': params['at'], 'book': book.number, **get_book_location(book, params['at'])})
+
+
+class TopologyViewSet(ConditionalGetMixin, viewsets.ViewSet):
+    version_models = (BookHall, BookCase, BookShelf)
+
+    def list(self, request):
+        return self.conditional_response(request, lambda request: Response(get_library_topology()))
+
+
+class CacheStatsViewSet(viewsets.ViewSet):
+    def list(self, request):
+        return Response(get_cache_stats())
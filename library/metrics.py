@@ -0,0 +1,202 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+logger = logging.getLogger('library.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# имя метрики: (описание, границы корзин)
+HISTOGRAMS = {
+    'library_request_duration_seconds': ('Время обработки запроса', LATENCY_BUCKETS),
+    'library_request_db_seconds': ('Суммарное время SQL-запросов за запрос', LATENCY_BUCKETS),
+    'library_request_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+    'library_request_render_seconds': ('Время сериализации ответа в JSON/HTML', LATENCY_BUCKETS),
+    'library_response_size_bytes': ('Размер тела ответа', SIZE_BUCKETS),
+}
+
+LABELS = ('view', 'method')
+
+
+def get_metrics_settings():
+    return {'ENABLED': True, 'PATH': '/metrics/', 'SLOW_QUERY_SECONDS': None, **getattr(settings, 'METRICS', {})}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, (None, 0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def render(self, name):
+        lines = []
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ','.join('%s="%s"' % (key, escape_label(value)) for key, value in zip(LABELS, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, label_text, bound, cumulative))
+            lines.append('%s_sum{%s} %s' % (name, label_text, repr(float(total))))
+            lines.append('%s_count{%s} %d' % (name, label_text, cumulative))
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    # метрики процесса; при нескольких воркерах каждый отдает свои, сводит их Prometheus
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.histograms = {name: Histogram(buckets) for name, (description, buckets) in HISTOGRAMS.items()}
+
+    def observe(self, labels, values):
+        with self.lock:
+            for name, value in values.items():
+                self.histograms[name].observe(labels, value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (description, buckets) in HISTOGRAMS.items():
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s histogram' % name)
+                lines.extend(self.histograms[name].render(name))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# метрики текущего запроса; контекст копируется в поток sync_to_async, где под ASGI выполняются запросы к БД
+CURRENT_METRICS = contextvars.ContextVar('request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = CURRENT_METRICS.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # соединения у каждого потока свои, поэтому обертка ставится на каждое при подключении
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class RequestMetrics:
+    def __init__(self, request, slow_query_seconds):
+        self.request = request
+        self.slow_query_seconds = slow_query_seconds
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_started = None
+        self.started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += duration
+            if self.slow_query_seconds is not None and duration >= self.slow_query_seconds:
+                logger.warning('Медленный SQL-запрос %.3f с (%s): %s', duration, self.view_name(), sql)
+
+    def view_name(self):
+        match = self.request.resolver_match
+        return (match.view_name or match.route) if match else 'unmatched'
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        response.add_post_render_callback(self.finish_render)
+
+    def finish_render(self, response):
+        self.render_seconds += time.perf_counter() - self.render_started
+
+    def finish(self, response):
+        values = {
+            'library_request_duration_seconds': time.perf_counter() - self.started,
+            'library_request_db_seconds': self.db_seconds,
+            'library_request_queries': self.queries,
+            'library_request_render_seconds': self.render_seconds,
+        }
+        if not response.streaming:
+            values['library_response_size_bytes'] = len(response.content)
+        REGISTRY.observe((self.view_name(), self.request.method), values)
+
+
+class MetricsMiddleware:
+    # число и время SQL-запросов, время рендеринга и размер ответа по имени маршрута
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        config = get_metrics_settings()
+        if not config['ENABLED'] or request.path == config['PATH']:
+            return None, None
+        metrics = request.request_metrics = RequestMetrics(request, config['SLOW_QUERY_SECONDS'])
+        return metrics, CURRENT_METRICS.set(metrics)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self.start(request)
+        if metrics is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            CURRENT_METRICS.reset(token)
+        metrics.finish(response)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = self.start(request)
+        if metrics is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            CURRENT_METRICS.reset(token)
+        metrics.finish(response)
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = getattr(request, 'request_metrics', None)
+        if metrics is not None:
+            metrics.start_render(response)
+        return response
+
+
+def metrics_view(request):
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
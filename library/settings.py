@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +79,88 @@ WSGI_APPLICATION = 'library.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Настройки соединения SQLite: WAL пускает чтение параллельно записи, busy_timeout заставляет
+# ждать блокировку вместо немедленного "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join('PRAGMA %s=%s' % pragma for pragma in SQLITE_PRAGMAS.items()),
+            # запись берет блокировку в начале транзакции: без взаимоблокировки при повышении блокировки чтения
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # тесты на файле, а не в памяти с общим кэшем: там блокировки таблиц не ждут busy_timeout
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# DB_ENGINE=postgresql переключает проект на PostgreSQL (нужен psycopg), параметры подключения - из окружения.
+# Локальный сервер для разработки и тестов: docker compose up -d postgres
+if os.environ.get('DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'library'),
+        'USER': os.environ.get('DB_USER', 'library'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'library'),
+        'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+
+# Кэш ответов справочных вьюсетов. Для нескольких процессов укажите общий бэкенд,
+# например 'django.core.cache.backends.redis.RedisCache' с LOCATION сервера Redis.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Метрики запросов в формате Prometheus на PATH. SLOW_QUERY_SECONDS - порог записи SQL-запроса
+# в лог library.metrics, None - не записывать
+METRICS = {
+    'ENABLED': True,
+    'PATH': '/metrics/',
+    'SLOW_QUERY_SECONDS': 0.5,
+}
+
+# Архивация журнала перемещений: закрытые записи старше HORIZON_DAYS переносятся пачками по BATCH_SIZE
+JOURNAL_ARCHIVE = {
+    'HORIZON_DAYS': 365,
+    'BATCH_SIZE': 5000,
+}
+
+# Снимки расстановки книг для восстановления истории (bookHouse/history.py): take_location_snapshot
+# по расписанию делает новый снимок, если с прошлого прошло INTERVAL_DAYS
+LOCATION_SNAPSHOTS = {
+    'INTERVAL_DAYS': 7,
+}
+
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'bookHouse.pagination.LibraryCursorPagination',
+    'PAGE_SIZE': 100,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -22,8 +22,11 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import routers, permissions
 
+from bookHouse import async_views
+from library.metrics import metrics_view, get_metrics_settings
 from bookHouse.views import BookViewSet, ReaderViewSet, PublicationTypeViewSet, AuthorViewSet, LibrarianViewSet, \
-    BookHallViewSet, BookCaseViewSet, BookShelfViewSet, MoveBookJournalViewSet
+    BookHallViewSet, BookCaseViewSet, BookShelfViewSet, MoveBookJournalViewSet, CirculationViewSet, \
+    TopologyViewSet, CacheStatsViewSet, RelocationViewSet, HistoryViewSet
 
 router = routers.DefaultRouter()
 router.register(r'books', BookViewSet)
@@ -35,6 +38,11 @@ router.register(r'halls', BookHallViewSet)
 router.register(r'cases', BookCaseViewSet)
 router.register(r'shelfs', BookShelfViewSet)
 router.register(r'move-book', MoveBookJournalViewSet)
+router.register(r'circulation', CirculationViewSet, basename='circulation')
+router.register(r'relocation', RelocationViewSet, basename='relocation')
+router.register(r'history', HistoryViewSet, basename='history')
+router.register(r'topology', TopologyViewSet, basename='topology')
+router.register(r'cache-stats', CacheStatsViewSet, basename='cache-stats')
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -51,6 +59,13 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/books/', async_views.book_list, name='async-book-list'),
+    path('async/books/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('async/books/<int:pk>/journal/', async_views.book_journal, name='async-book-journal'),
+    path('async/readers/', async_views.reader_list, name='async-reader-list'),
+    path('async/readers/<int:pk>/', async_views.reader_detail, name='async-reader-detail'),
+    path('async/move-book/', async_views.move_book_list, name='async-move-book-list'),
+    path(get_metrics_settings()['PATH'].lstrip('/'), metrics_view, name='metrics'),
     path('admin/', admin.site.urls),
     # path('booklist/', BookViewSet.as_view()),
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),